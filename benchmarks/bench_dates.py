@@ -0,0 +1,45 @@
+"""
+Times the date parsing the loaders share (financefunctions._parse_dates) on a 20 year series of BoJ/JSE style
+'yyyy-mm-dd' strings, against pd.to_datetime guessing the format (what _clean_jse_table and the full fx parser used
+to do) and pd.to_datetime with the format given. The three results are checked to match.
+
+The loaders also used to call pd.to_datetime(..., format='%Y%m%d', errors='ignore'), which doesn't match these dates:
+older pandas quietly handed the strings back unparsed, and pandas 3 no longer accepts errors='ignore' at all.
+
+Run it from the root of the repo with: python benchmarks/bench_dates.py
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import financefunctions as ff
+
+
+def best_of(func, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    #newest first and as python strings, the way they come out of _read_table
+    dates = pd.bdate_range(end='2021-12-31', periods=20*252)[::-1].strftime('%Y-%m-%d').to_numpy(dtype=object)
+    
+    guessed_time, guessed = best_of(pd.to_datetime, dates)
+    format_time, formatted = best_of(lambda values: pd.to_datetime(values, format=ff.DATE_FORMAT), dates)
+    new_time, (parsed, keep) = best_of(ff._parse_dates, dates, 'boj')
+    
+    assert (parsed == guessed).all() and (parsed == formatted).all()
+    assert keep.sum() == len(dates) - 1 #2020-09-03 is a bad BoJ date
+    
+    print(f'{len(dates)} dates')
+    print(f'pd.to_datetime, guessed format: {guessed_time*1000:8.2f} ms')
+    print(f'pd.to_datetime, format given:   {format_time*1000:8.2f} ms')
+    print(f'_parse_dates:                   {new_time*1000:8.2f} ms')
+    print(f'speedup over the guessed format: {guessed_time/new_time:.1f}x')
@@ -0,0 +1,78 @@
+"""
+Times the BoJ table parser behind get_full_fx_rates on a synthetic 20 year table, against the old
+one-loop-per-currency version it replaced.
+
+Run it from the root of the repo with: python benchmarks/bench_full_fx_rates.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import financefunctions as ff
+
+
+def make_boj_table(years=20, seed=0):
+    #builds a table laid out the same way as the one on the BoJ site: newest first, 6 rows per date
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2021-12-31', periods=years*252)[::-1].strftime('%Y-%m-%d')
+    labels = ['', 'Rate', 'Volume', 'High', 'Low', '10 Day MA']
+    
+    first = np.empty(len(dates)*6, dtype=object)
+    first[0::6] = dates
+    for k in range(1, 6):
+        first[k::6] = labels[k]
+    
+    values = 100 + rng.standard_normal((len(dates)*6, 8)).cumsum(axis=0)*0.01
+    values = np.char.mod('%.4f', values).astype(float) #4 decimals like the site, so half-cent values like 100.2650 come up
+    values[0::6] = np.nan
+    
+    table = pd.DataFrame(values, columns=range(1, 9))
+    table.insert(0, 0, first)
+    return table
+
+
+def parse_with_loops(data):
+    #the old parser, one pass of scalar iloc lookups per currency/side
+    date = [data.iloc[i, 0] for i in range(0, len(data), 6)][::-1]
+    frames = []
+    for col in range(1, 9):
+        rates, volume, high, low, tenday = [], [], [], [], []
+        for i in range(1, len(data), 6):
+            rates.append(round(float(data.iloc[i, col]), 2))
+            volume.append(round(float(data.iloc[i+1, col]), 2))
+            high.append(round(float(data.iloc[i+2, col]), 2))
+            low.append(round(float(data.iloc[i+3, col]), 2))
+            tenday.append(round(float(data.iloc[i+4, col]), 2))
+        frame = pd.DataFrame({'Exchange Rate': rates[::-1], 'Volume Traded': volume[::-1], 'High': high[::-1],
+                              'Low': low[::-1], '10 Day MA': tenday[::-1]}, index=pd.to_datetime(date))
+        frames.append(frame.drop(index='2020-09-03'))
+    return tuple(frames)
+
+
+def best_of(func, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    table = make_boj_table(years=20)
+    
+    old_time, old = best_of(parse_with_loops, table, repeat=1)
+    new_time, new = best_of(ff._parse_full_fx_table, table)
+    
+    for a, b in zip(old, new):
+        np.testing.assert_array_equal(a.to_numpy(), b.to_numpy()) #exactly the same, half-cent values included
+        assert (a.index == b.index).all()
+    
+    print(f'{len(table)} rows ({len(table)//6} dates)')
+    print(f'iloc loops:  {old_time*1000:10.1f} ms')
+    print(f'vectorized:  {new_time*1000:10.1f} ms')
+    print(f'speedup:     {old_time/new_time:10.1f}x')
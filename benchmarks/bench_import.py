@@ -0,0 +1,59 @@
+"""
+Checks that `import financefunctions` stays cheap, for the short cron and command line jobs that only need a loader
+or drawdown.
+
+numpy and pandas are needed by everything, so they are imported first and left out: the budget is for what
+financefunctions adds on top of them, timed in the same interpreter right after pandas is in. The heavy optional
+dependencies (quantstats and the plotting, scraping and modelling libraries it or the reports use) must not be
+imported at all until a function that needs them is called.
+
+Every measurement runs in a fresh interpreter, and the best of a few runs is kept.
+
+Run it from the root of the repo with: python benchmarks/bench_import.py [--budget-ms 100]
+It exits with an error if the budget is blown or a heavy module gets imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ['quantstats', 'matplotlib', 'seaborn', 'scipy', 'sklearn', 'yfinance', 'requests', 'lxml', 'asyncio', 'urllib.request']
+
+
+def import_time(module, after=(), repeat=5):
+    #the best import time of module in a fresh interpreter, once the modules in after are already imported, in ms
+    code = f'import time{"".join(", " + name for name in after)}; start = time.perf_counter(); import {module}; print((time.perf_counter() - start)*1000)'
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        times.append(float(result.stdout))
+    return min(times)
+
+
+def loaded_modules():
+    code = 'import sys, financefunctions; print(" ".join(sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks the import time of financefunctions against a budget.')
+    parser.add_argument('--budget-ms', type=float, default=100, help='how long financefunctions may take to import on top of pandas')
+    args = parser.parse_args()
+    
+    pandas = import_time('pandas')
+    own = import_time('financefunctions', after=['numpy', 'pandas'])
+    heavy = [module for module in HEAVY if module in loaded_modules()]
+    
+    print(f'import pandas:            {pandas:8.1f} ms')
+    print(f'financefunctions itself:  {own:8.1f} ms (budget {args.budget_ms:.0f} ms)')
+    
+    problems = []
+    if own > args.budget_ms:
+        problems.append(f'financefunctions takes {own:.1f} ms to import on top of pandas, over the {args.budget_ms:.0f} ms budget')
+    if heavy:
+        problems.append(f'importing financefunctions also imports {", ".join(heavy)}')
+    if problems:
+        sys.exit('\n'.join(problems))
@@ -0,0 +1,51 @@
+"""
+Times the streaming table extractor the loaders use (financefunctions._read_table) against pd.read_html, on fixture
+pages laid out like the BoJ and JSE ones: a few small tables around the one we want, which holds 20 years of data.
+Both the time and the peak python-side memory (as seen by tracemalloc) are reported, and the two results are checked to match.
+
+Run it from the root of the repo with: python benchmarks/bench_read_table.py
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import financefunctions as ff
+from synthetic import make_boj_page, make_jse_page
+
+
+def measure(func, *args, repeat=3):
+    #the time is the best of a few runs without tracemalloc (which slows python code down a lot), the peak comes from one more run with it
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+if __name__ == '__main__':
+    for name, page, index in [('BoJ full fx', make_boj_page(), 3), ('JSE prices', make_jse_page(), 0)]:
+        old_time, old_peak, old = measure(lambda: pd.read_html(io.BytesIO(page))[index])
+        new_time, new_peak, new = measure(ff._read_table, page, index)
+        
+        assert list(old.columns) == list(new.columns)
+        for column in old.columns:
+            if pd.api.types.is_numeric_dtype(old[column]):
+                np.testing.assert_allclose(old[column].to_numpy(dtype=float), new[column].to_numpy(dtype=float))
+            else:
+                assert old[column].fillna('').astype(str).tolist() == new[column].fillna('').astype(str).tolist()
+        
+        print(f'{name}: {len(page)/1e6:.1f} MB page, {len(new)} rows')
+        print(f'  pd.read_html: {old_time*1000:8.0f} ms  {old_peak/1e6:7.1f} MB peak')
+        print(f'  _read_table:  {new_time*1000:8.0f} ms  {new_peak/1e6:7.1f} MB peak')
@@ -0,0 +1,246 @@
+"""
+Runs every benchmark case, on fixtures of increasing size, and checks the results against a stored baseline.
+
+Every case/size runs in a fresh process, so the numbers of one case can't leak into the next one. Three things are
+measured for each:
+    time: the best of a few runs, in ms
+    peak RSS: how far the resident memory of the process grew above where it was before the run, in MB
+    peak alloc: the peak of the memory allocated while the run was going, as seen by tracemalloc (python objects and
+                numpy arrays), in MB
+
+The pages come from benchmarks/synthetic.py and are handed to the loaders through an in-memory page source (see
+financefunctions.set_source), so the whole download path runs, minus the network.
+
+Run it from the root of the repo with:
+    python benchmarks/run_benchmarks.py                 #runs everything and compares it with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save          #runs everything and writes the results as the new baseline
+    python benchmarks/run_benchmarks.py --only drawdown #only the cases whose name contains 'drawdown'
+
+It exits with an error if a case fails, or if its time, peak RSS or peak alloc is over `--tolerance` times the baseline. The
+baseline is only worth comparing against on the machine it was saved on.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import financefunctions as ff
+import synthetic
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+class PageSource:
+    #serves the same page for every url, so the loaders run without the network or the disk
+    
+    def __init__(self, page):
+        self.page = page
+    
+    def fetch(self, url):
+        return self.page
+
+
+def jse_parse(years):
+    ff.set_source(PageSource(synthetic.make_jse_page(years)))
+    return lambda: ff.get_jse_data('AAA')
+
+
+def fx_rates(years):
+    ff.set_source(PageSource(synthetic.make_boj_rates_page(years)))
+    return lambda: ff.get_fx_rates()
+
+
+def full_fx_rates(years):
+    ff.set_source(PageSource(synthetic.make_boj_page(years)))
+    return lambda: ff.get_full_fx_rates()
+
+
+def drawdown(rows):
+    returns = pd.Series(np.random.default_rng(0).normal(0, 0.001, rows), index=pd.date_range('1990-01-01', periods=rows, freq='min'))
+    return lambda: ff.drawdown(returns)
+
+
+def report_metrics(tickers):
+    returns = pd.DataFrame(np.random.default_rng(0).normal(0.0003, 0.01, (5040, tickers)), index=pd.bdate_range(end='2021-12-31', periods=5040))
+    return lambda: ff.report_metrics(returns)
+
+
+def notebook_rates(years):
+    ff.set_source(PageSource(synthetic.make_boj_page(years)))
+    return ff.get_full_fx_rates()
+
+
+def predict_fx(years):
+    #the train/predict loop of the notebook's predict_fx, without the plots: one LinearRegression per pair on the first 85%
+    from sklearn.linear_model import LinearRegression
+    rates = notebook_rates(years)
+    
+    def run():
+        for data in rates[:6]:
+            X, y = data.drop('Exchange Rate', axis=1), data['Exchange Rate']
+            split = int(round(len(data)*0.85, 0))
+            LinearRegression().fit(X[:split], y[:split]).predict(X[split:])
+    return run
+
+
+def predict_fx_sma(years, sma=3):
+    #same for predict_fx_sma: the target is the SMA of the rate
+    from sklearn.linear_model import LinearRegression
+    rates = notebook_rates(years)
+    
+    def run():
+        for data in rates[:6]:
+            data = data.copy()
+            data[f'Smooth - {sma}SMA'] = data['Exchange Rate'].rolling(window=sma).mean()
+            data = data.dropna(how='any')
+            X, y = data.drop(f'Smooth - {sma}SMA', axis=1), data[f'Smooth - {sma}SMA']
+            split = int(round(len(data)*0.85, 0))
+            LinearRegression().fit(X[:split], y[:split]).predict(X[split:])
+    return run
+
+
+def predict_fx_batched(years):
+    #the same models as predict_fx, all pairs in one BatchedRegression
+    X, y = ff.fx_arrays(notebook_rates(years))
+    split = int(round(X.shape[1]*0.85, 0))
+    return lambda: ff.BatchedRegression().fit(X[:, :split], y[:, :split]).predict(X[:, split:])
+
+
+def predict_fx_registry(years):
+    #scoring every pair for every date from a stored model: the hash check that skips the refit, then predict_many
+    import tempfile
+    rates = notebook_rates(years)
+    registry = ff.ModelRegistry(tempfile.mkdtemp())
+    registry.fit(rates)
+    X, _ = ff.fx_arrays(rates)
+    return lambda: registry.fit(rates).predict_many(ff.FX_SERIES, X)
+
+
+CASES = {
+    'jse_parse': (jse_parse, [1, 10, 100]),
+    'fx_rates': (fx_rates, [2, 20, 100]),
+    'full_fx_rates': (full_fx_rates, [2, 20, 100]),
+    'drawdown': (drawdown, [10**3, 10**4, 10**5, 10**6, 10**7]),
+    'report_metrics': (report_metrics, [10, 100, 1000]),
+    'predict_fx': (predict_fx, [2, 20, 100]),
+    'predict_fx_sma': (predict_fx_sma, [2, 20, 100]),
+    'predict_fx_batched': (predict_fx_batched, [2, 20, 100]),
+    'predict_fx_registry': (predict_fx_registry, [2, 20, 100]),
+}
+
+
+def resident():
+    #the current and the peak resident memory of this process, in bytes. The peak can be reset on linux (see reset_peak)
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f)
+        return int(status['VmRSS'].split()[0])*1024, int(status['VmHWM'].split()[0])*1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == 'darwin' else 1024
+        return peak, peak
+
+
+def reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError: #not linux, so the peak includes the setup
+        pass
+
+
+def measure(name, size, repeat):
+    func = CASES[name][0](size)
+    func() #warm up, so imports and caches aren't counted
+    
+    reset_peak()
+    before = resident()[0]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    peak_rss = resident()[1] - before
+    
+    tracemalloc.start()
+    func()
+    peak_alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    return {'time_ms': min(times)*1000, 'peak_rss_mb': max(peak_rss, 0)/1e6, 'peak_alloc_mb': peak_alloc/1e6}
+
+
+def run(name, size, repeat):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        try:
+            return pool.submit(measure, name, size, repeat).result()
+        except Exception as e:
+            return {'error': f'{type(e).__name__}: {e}'}
+
+
+def regressions(result, base, tolerance):
+    if 'error' in result:
+        return [result['error']]
+    if base is None or 'error' in base:
+        return []
+    found = []
+    if result['time_ms'] > base['time_ms']*tolerance + 1: #the 1 ms keeps the tiny cases from failing on noise
+        found.append(f"time {base['time_ms']:.1f} -> {result['time_ms']:.1f} ms")
+    if result['peak_rss_mb'] > base['peak_rss_mb']*tolerance + 5:
+        found.append(f"peak RSS {base['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB")
+    if result['peak_alloc_mb'] > base['peak_alloc_mb']*tolerance + 0.1: #tracemalloc's counts hardly move between runs, so only a little slack
+        found.append(f"peak alloc {base['peak_alloc_mb']:.1f} -> {result['peak_alloc_mb']:.1f} MB")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the financefunctions benchmarks and compares them with a baseline.')
+    parser.add_argument('--only', default='', help='only run the cases whose name contains this')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='how many times slower (or bigger) than the baseline counts as a regression')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    
+    results, failed = {}, []
+    print(f"{'case':<28}{'time ms':>12}{'peak RSS MB':>14}{'peak alloc MB':>15}  vs baseline")
+    for name, (_, sizes) in CASES.items():
+        if args.only not in name:
+            continue
+        for size in sizes:
+            key = f'{name}[{size}]'
+            result = results[key] = run(name, size, args.repeat)
+            base = baseline.get(key)
+            found = [] if args.save else regressions(result, base, args.tolerance)
+            failed += [f'{key}: {problem}' for problem in found]
+    
+            if 'error' in result:
+                print(f"{key:<28}{'failed':>12}  {result['error']}")
+                continue
+            change = f"{result['time_ms']/base['time_ms']:.2f}x" if base and 'error' not in base else 'new'
+            print(f"{key:<28}{result['time_ms']:>12.1f}{result['peak_rss_mb']:>14.1f}{result['peak_alloc_mb']:>15.1f}  {change}{'  REGRESSION' if found else ''}")
+    
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f'Saved {len(results)} results to {args.baseline}')
+    elif failed:
+        sys.exit('Regressions:\n  ' + '\n  '.join(failed))
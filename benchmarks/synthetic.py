@@ -0,0 +1,114 @@
+"""
+Synthetic pages laid out like the BoJ and JSE ones, so the loaders can be run and timed without the sites (the BoJ
+one has changed, so its loaders can't be run against it anymore). The size of the history is up to you: years of
+dates for every page, and any number of JSE tickers.
+
+write_fixtures saves the pages in a financefunctions.FixtureStore under the urls the loaders ask for, so that after
+ff.set_source(ff.ReplaySource(store)) get_full_fx_rates, get_jse_data_many and the rest work exactly as they would
+against the sites. From the command line, run it from the root of the repo with:
+
+    python benchmarks/synthetic.py fixtures --years 20 --tickers 50
+
+Dates before 1677 don't fit in a pandas timestamp, so a history can't be much longer than 340 years. Past that, use
+more tickers to get a bigger load.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import financefunctions as ff
+
+
+END = '2021-12-31'
+
+
+def layout_table(n):
+    return '<table>' + ''.join(f'<tr><td><a href="/page{i}">Link {i}</a></td><td>Menu</td></tr>' for i in range(n)) + '</table>'
+
+
+def boj_dates(years, end=END):
+    return pd.bdate_range(end=end, periods=years*252)[::-1].strftime('%Y-%m-%d')
+
+
+def make_boj_page(years=20, seed=0, end=END):
+    #same shape as the BoJ full fx page: the data table is the 4th table, with 6 rows per date, newest first
+    rng = np.random.default_rng(seed)
+    dates = boj_dates(years, end)
+    labels = ['Rate', 'Volume', 'High', 'Low', '10 Day MA']
+    
+    rows = ['<tr><th>Date</th>' + ''.join(f'<th colspan="2">{c}</th>' for c in ['USD', 'GBP', 'CAD', 'EUR']) + '</tr>',
+            '<tr><th></th>' + '<th>BUY</th><th>SELL</th>'*4 + '</tr>']
+    values = 100 + rng.standard_normal((len(dates)*5, 8)).cumsum(axis=0)*0.01
+    for i, d in enumerate(dates):
+        rows.append(f'<tr><td>{d}</td>' + '<td></td>'*8 + '</tr>')
+        for k, label in enumerate(labels):
+            rows.append(f'<tr><td>{label}</td>' + ''.join(f'<td>{v:,.4f}</td>' for v in values[i*5 + k]) + '</tr>')
+    
+    body = layout_table(20) + layout_table(5) + layout_table(3) + '<table>' + ''.join(rows) + '</table>' + layout_table(40)
+    return f'<html><body>{body}</body></html>'.encode()
+
+
+def make_boj_rates_page(years=20, seed=0, end=END):
+    #same shape as the BoJ rates-only page behind get_fx_rates: a row with the date, then a row with the 8 rates
+    rng = np.random.default_rng(seed)
+    dates = boj_dates(years, end)
+    
+    rows = ['<tr><th>Date</th>' + ''.join(f'<th colspan="2">{c}</th>' for c in ['USD', 'GBP', 'CAD', 'EUR']) + '</tr>',
+            '<tr><th></th>' + '<th>BUY</th><th>SELL</th>'*4 + '</tr>']
+    values = 100 + rng.standard_normal((len(dates), 8)).cumsum(axis=0)*0.01
+    for d, row in zip(dates, values):
+        rows.append(f'<tr><td>{d}</td>' + '<td></td>'*8 + '</tr>')
+        rows.append('<tr><td>Rate</td>' + ''.join(f'<td>{v:,.4f}</td>' for v in row) + '</tr>')
+    
+    body = layout_table(20) + layout_table(5) + layout_table(3) + '<table>' + ''.join(rows) + '</table>' + layout_table(40)
+    return f'<html><body>{body}</body></html>'.encode()
+
+
+def make_jse_page(years=20, seed=0, end=END):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end, periods=years*252)[::-1]
+    frame = pd.DataFrame({'': np.arange(len(dates)),
+                          'Date': dates.strftime('%Y-%m-%d'),
+                          'Close Price ($)': np.round(50 + rng.standard_normal(len(dates)).cumsum()*0.1, 2),
+                          'Volume (non block)': rng.integers(0, 1_000_000, len(dates)),
+                          'Today  High ($)': np.round(51 + rng.standard_normal(len(dates)).cumsum()*0.1, 2),
+                          'Notes': [''] * len(dates)})
+    return ('<html><body>' + frame.to_html(index=False, na_rep='') + layout_table(40) + '</body></html>').encode()
+
+
+def tickers(n):
+    #made up tickers, AAA, AAB, ...
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    return [''.join(letters[[i//676 % 26, i//26 % 26, i % 26]]) for i in range(n)]
+
+
+def write_fixtures(path, years=20, n_tickers=10, seed=0, end=END):
+    """
+    Saves a BoJ full fx page, a BoJ rates page and one JSE page per ticker in a FixtureStore at path, and returns the
+    store and the tickers. Every JSE page gets its own seed, so the tickers don't all move together.
+    """
+    store = ff.FixtureStore(path)
+    store.save(ff.BOJ_FULL_URL.format(start_date='2000-01-01', end_date=end), make_boj_page(years, seed, end))
+    store.save(ff.BOJ_URL.format(start_date='2000-01-01', end_date=end), make_boj_rates_page(years, seed, end))
+    
+    names = tickers(n_tickers)
+    for i, ticker in enumerate(names):
+        store.save(ff.JSE_URL.format(ticker=ticker, start_date='2000-01-01', end_date=end), make_jse_page(years, seed + 1 + i, end))
+    return store, names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes synthetic BoJ and JSE pages into a fixture store.')
+    parser.add_argument('path')
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--tickers', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    store, names = write_fixtures(args.path, args.years, args.tickers, args.seed)
+    size = sum(os.path.getsize(os.path.join(folder, name)) for folder, _, files in os.walk(args.path) for name in files)
+    print(f'{len(store.index)} pages ({args.years} years, {len(names)} tickers), {size/1e6:.1f} MB on disk in {args.path}')
@@ -1,128 +1,571 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date
+from functools import cached_property, lru_cache, wraps
+from urllib.parse import urlsplit
+import numpy as np
 import pandas as pd
-import quantstats as qs
 
 
-def get_jse_data(ticker, start_date = '2000-01-01', end_date = date.today()):
+_tracer = None #the Tracer that is recording, None when tracing is off (the default)
+
+
+class Tracer:
     """
-    This aim of this function is to scrape stock data from the Jamaica Stock Exchange. 
+    Records where the time goes inside the loaders and models: every stage (download, html parse, reshape, date
+    parsing, model fit, ...) becomes a span with its duration, its parent span, the bytes and rows it handled and how
+    much the memory grew while it ran. Nothing is recorded unless a Tracer is active, and when none is the
+    instrumentation costs one global lookup per call. For example:
     
-    ticker: Enter the ticker of the stock you wish to analyze
-    start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
-    end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+        with ff.Tracer() as tracer:
+            ff.get_full_fx_rates()
+        print(tracer.summary())
+        tracer.to_json('trace.jsonl')
+    
+    memory: 'rss' measures the growth of the resident memory of the process (cheap, linux only), 'tracemalloc' the
+            growth of the memory python and numpy allocated (exact, but python code runs a lot slower), None nothing.
     
     """
     
-    ticker = ticker.upper() #Ensures that all the letters of the ticker are capitalized. This is to ensure that the code doesn't get any errors later on, since tickers are normally all caps.
+    def __init__(self, memory = 'rss'):
+        self.memory = memory
+        self.spans = []
+        self.trace_id = os.urandom(16).hex()
+        self._ids = iter(range(1, 1 << 62))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+    
+    def __enter__(self):
+        global _tracer
+        if self.memory == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._previous, _tracer = _tracer, self
+        return self
+    
+    def __exit__(self, *exc):
+        global _tracer
+        _tracer = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+    
+    def _memory(self):
+        if self.memory == 'tracemalloc':
+            return tracemalloc.get_traced_memory()[0]
+        if self.memory == 'rss':
+            try:
+                with open('/proc/self/statm') as f:
+                    return int(f.read().split()[1]) * _PAGE_SIZE
+            except OSError:
+                return None
+        return None
+    
+    def span(self, name, **attributes):
+        """Returns a context manager that records one span. Attributes can be added while it runs with span.set(...)."""
+        return _Span(self, name, attributes)
+    
+    def to_json(self, path = None):
+        """
+        Returns the spans in the OpenTelemetry span layout (trace and span ids, unix nanosecond start and end times,
+        attributes), and writes them to path as json lines if one is given.
+        
+        """
+        spans = [{'name': span['name'],
+                  'trace_id': self.trace_id,
+                  'span_id': f"{span['id']:016x}",
+                  'parent_span_id': f"{span['parent']:016x}" if span['parent'] else None,
+                  'start_time_unix_nano': span['start'],
+                  'end_time_unix_nano': span['start'] + span['duration'],
+                  'attributes': {'thread.id': span['thread'], **span['attributes']}} for span in self.spans]
+        if path is not None:
+            with open(path, 'w') as f:
+                for span in spans:
+                    f.write(json.dumps(span, default=str) + '\n')
+        return spans
+    
+    def summary(self):
+        """
+        One row per stage, slowest first: how many times it ran, its total, own (without the stages inside it), mean
+        and longest time in ms, and the bytes, rows and memory growth (MB) it added up to.
+        
+        """
+        columns = ['Calls', 'Total ms', 'Self ms', 'Mean ms', 'Max ms', 'Bytes', 'Rows', 'Memory MB']
+        if not self.spans:
+            return pd.DataFrame(columns=columns)
+        
+        spans = pd.DataFrame({'name': [span['name'] for span in self.spans],
+                              'id': [span['id'] for span in self.spans],
+                              'parent': [span['parent'] for span in self.spans],
+                              'ms': [span['duration']/1e6 for span in self.spans],
+                              'bytes': [span['attributes'].get('bytes', 0) for span in self.spans],
+                              'rows': [span['attributes'].get('rows', 0) for span in self.spans],
+                              'memory': [(span['memory'] or 0)/1e6 for span in self.spans]})
+        children = spans.groupby('parent')['ms'].sum()
+        spans['self'] = spans['ms'] - spans['id'].map(children).fillna(0)
+        
+        table = spans.groupby('name').agg(**{'Calls': ('ms', 'size'), 'Total ms': ('ms', 'sum'), 'Self ms': ('self', 'sum'),
+                                             'Mean ms': ('ms', 'mean'), 'Max ms': ('ms', 'max'), 'Bytes': ('bytes', 'sum'),
+                                             'Rows': ('rows', 'sum'), 'Memory MB': ('memory', 'sum')})
+        return table.sort_values('Total ms', ascending=False)
+
+
+class _Span:
+    
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.record = {'name': name, 'attributes': attributes}
+    
+    def set(self, **attributes):
+        self.record['attributes'].update(attributes)
+    
+    def __enter__(self):
+        tracer, record = self.tracer, self.record
+        stack = tracer._local.__dict__.setdefault('stack', [])
+        with tracer._lock:
+            record['id'] = next(tracer._ids)
+        record['parent'] = stack[-1] if stack else None
+        record['thread'] = threading.get_ident()
+        stack.append(record['id'])
+        self._memory = tracer._memory()
+        record['start'] = time.time_ns()
+        self._start = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, kind, error, trace):
+        record = self.record
+        record['duration'] = time.perf_counter_ns() - self._start
+        memory = self.tracer._memory()
+        record['memory'] = memory - self._memory if memory is not None and self._memory is not None else None
+        if kind is not None:
+            record['attributes']['error'] = f'{kind.__name__}: {error}'
+        self.tracer._local.stack.pop()
+        with self.tracer._lock:
+            self.tracer.spans.append(record)
+
+
+class _NoSpan:
+    #what _span hands out when tracing is off: does nothing, and is shared so nothing gets built either
     
-    #Catches an error if the user forgets to input the start date and uses of the fault value of January 1, 2017.
-    if start_date:
-        start_date = pd.to_datetime(start_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        start_date = '2000-01-01'
+    def set(self, **attributes):
+        pass
     
-    #same as above 
-    if end_date:
-        end_date = pd.to_datetime(end_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        end_date = date.today()
+    def __enter__(self):
+        return self
     
-    data = pd.read_html(f"""https://www.jamstockex.com/market-data/download-data/price-history/{ticker}/{start_date}/{end_date}""") #The Jamaica Stock Exchange has a pattern with how they store their data. I found that pattern, as such, I'm leveraging it. This line scrapes the data from the JSE and tries to return it as a dataframe.
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _span(name, **attributes):
+    return _NO_SPAN if _tracer is None else _tracer.span(name, **attributes)
+
+
+def _traced(name, before = None, after = None):
+    """
+    Records every call of the decorated function as a span while a Tracer is active.
+    before(*args, **kwargs) and after(result) return extra attributes, e.g. the bytes that went in or the rows that came out.
     
-    data = data[0] #The data wasn't returned as a dataframe, instead, it was returned as an array with one element: the data. This line indexes into the array amd accesses the data.
+    """
+    def decorate(func):
+        @wraps(func)
+        def traced(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name, **(before(*args, **kwargs) if before else {})) as span:
+                result = func(*args, **kwargs)
+                if after:
+                    span.set(**after(result))
+                return result
+        return traced
+    return decorate
+
+
+JSE_URL = 'https://www.jamstockex.com/market-data/download-data/price-history/{ticker}/{start_date}/{end_date}' #The Jamaica Stock Exchange has a pattern with how they store their data. I found that pattern, as such, I'm leveraging it.
+
+
+BOJ_URL = 'http://www.boj.org.jm/foreign_exchange/searchfx.php?iAll=1&iUSD=1&iGBP=1&iCAD=1&iEUR=1&rate=1&strFromDate={start_date}&strToDate={end_date}&Enter='
+BOJ_FULL_URL = 'http://www.boj.org.jm/foreign_exchange/searchfx.php?iAll=1&iUSD=1&iGBP=1&iCAD=1&iEUR=1&rate=1&high=1&volume=1&low=1&tenday=1&all=1&strFromDate={start_date}&strToDate={end_date}&Enter='
+
+
+@_traced('fetch', before=lambda url: {'url': url}, after=lambda page: {'bytes': len(page)})
+def _fetch_page(url):
+    return _source.fetch(url)
+
+
+class LiveSource:
+    """Downloads the pages from the sites themselves. This is what the loaders use unless set_source was called."""
     
-    del data['Unnamed: 0'] #deletes an unnecessary row
+    def fetch(self, url):
+        from urllib.request import urlopen #only needed when something actually gets downloaded
+        
+        with urlopen(url, timeout=60) as response:
+            return response.read()
+
+
+class RecordSource:
+    """Downloads the pages with another source (live by default) and saves every response in a FixtureStore on the way."""
     
-    data.index = data['Date'] #assigns the "Date" column as the index
+    def __init__(self, store, source = None):
+        self.store = store
+        self.source = source or LiveSource()
     
-    del data['Date'] #deletes the row
+    def fetch(self, url):
+        page = self.source.fetch(url)
+        self.store.save(url, page)
+        return page
+
+
+class ReplaySource:
+    """Serves the pages saved in a FixtureStore, without touching the network."""
     
-    data.index = pd.to_datetime(data.index) #transforms the dates into a datetime object. Most libraries need the index to be a datetime object, so that's why this was done.
+    def __init__(self, store):
+        self.store = store
     
-    for i, b in enumerate(data.columns.values):
-        data.columns.values[i] = b.replace(" ($)", "").replace("  ", " ") #The titles of the columns aren't formatted properly, so these lines correct that.
-        
-    data = data.dropna(axis=1) #removes all the columns that don't have useful values
+    def fetch(self, url):
+        return self.store.load(url)
+
+
+_source = LiveSource()
+
+
+def set_source(source):
+    """
+    Changes where every loader gets its pages from: LiveSource(), RecordSource(store) or ReplaySource(store), or
+    anything else with a fetch(url) method that returns the raw page. Returns the source that was in use before.
     
-    return data #returns the datarame to the user 
+    """
+    global _source
+    previous, _source = _source, source
+    return previous
 
-####################################################################################################
 
-def get_jse_data_daily_returns(ticker, start_date = '2000-01-01', end_date = date.today()):
+class FixtureStore:
     """
-    This aim of this function is to scrape stock data from the Jamaica Stock Exchange. 
+    Saved raw responses, so that the loaders can be run (and timed) the same way every time without the sites.
     
-    ticker: Enter the ticker of the stock you wish to analyze
-    start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
-    end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+    Every response is gzipped and stored under its sha256 (path/objects/ab/abcd....gz), so a page that comes back
+    the same for many urls is only kept once. index.json maps every url to its hash. Urls are matched without their
+    scheme and host. A url with no saved response falls back to the same url recorded for other dates, as long as it
+    starts on or before the requested start date: the one that covers the whole requested range if there is one,
+    otherwise the one that ends last (so 'everything up to today' downloads keep replaying after the day they were
+    recorded). A request starting before anything recorded raises instead of quietly getting a different range, and
+    the loaders drop the rows outside the dates they asked for.
+    
+    path: the folder the store lives in. It gets created if it doesn't exist.
     
     """
     
-    ticker = ticker.upper() #Ensures that all the letters of the ticker are capitalized. This is to ensure that the code doesn't get any errors later on, since tickers are normallt all caps.
+    def __init__(self, path = 'fixtures'):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(path, 'index.json')) as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+    
+    @staticmethod
+    def key(url):
+        parts = urlsplit(url)
+        return parts.path + ('?' + parts.query if parts.query else '')
+    
+    def _object(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.gz')
+    
+    def save(self, url, page):
+        """Saves one response and returns its hash."""
+        digest = hashlib.sha256(page).hexdigest()
+        target = self._object(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp' #one per writer, threads and processes can save the same page at once
+            with gzip.open(temp, 'wb') as f:
+                f.write(page)
+            os.replace(temp, target)
+        
+        with self._lock: #the threads of get_jse_data_many record at the same time
+            self.index[self.key(url)] = digest
+            with open(os.path.join(self.path, 'index.json.tmp'), 'w') as f:
+                json.dump(self.index, f, indent=0)
+            os.replace(os.path.join(self.path, 'index.json.tmp'), os.path.join(self.path, 'index.json'))
+        return digest
+    
+    def load(self, url):
+        """Returns the saved response for url. Raises LookupError if there isn't one."""
+        key = self.key(url)
+        digest = self.index.get(key)
+        if digest is None:
+            undated, dates = _DATE_PATTERN.sub('*', key), _DATE_PATTERN.findall(key)
+            recorded = [(found[-1], d) for k, d in self.index.items() if _DATE_PATTERN.sub('*', k) == undated
+                        for found in [_DATE_PATTERN.findall(k)] if found[0] <= dates[0]] #(end date, hash) of the ones starting early enough
+            covering = [r for r in recorded if r[0] >= dates[-1]]
+            digest = (min(covering) if covering else max(recorded))[1] if recorded else None
+        if digest is None:
+            raise LookupError(f'No saved response for {url}')
+        with gzip.open(self._object(digest), 'rb') as f:
+            return f.read()
+    
+    def serve(self, host = '127.0.0.1', port = 0):
+        """
+        Serves the saved responses over http from a background thread, as a stand-in for the sites (for code that
+        can't go through set_source, like a browser or another process). Urls without a saved response get a 404.
+        Returns the server: server.url is its address and server.shutdown() stops it. For example:
+        
+            get_jse_data_many(tickers, base_url=JSE_URL.replace('https://www.jamstockex.com', server.url))
+        
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer #only needed here, so it isn't imported with the rest of the module
+        store = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    page, status = store.load(self.path), 200
+                except LookupError as e:
+                    page, status = str(e).encode(), 404
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.url = f'http://{host}:{server.server_address[1]}'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+##########################################################################################################################
+
+DATE_FORMAT = '%Y-%m-%d' #how both sites write their dates, and how we write them in the urls
+BAD_DATES = {'boj': ['2020-09-03'], 'jse': []} #days to leave out of every download from that source, because the site's numbers for them are wrong
+
+
+def _format_date(value):
+    #'yyyy-mm-dd' for the urls, from a string, date or Timestamp
+    return pd.Timestamp(value).strftime(DATE_FORMAT)
+
+
+def _parse_dates(values, source = None):
+    """
+    Turns the date column of a scraped table into a DatetimeIndex named 'Date', and says which rows to keep.
     
-    #Catches an error if the user forgets to input the start date and uses of the fault value of January 1, 2017.
-    if start_date:
-        start_date = pd.to_datetime(start_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        start_date = '2000-01-01'
+    The dates are 'yyyy-mm-dd' strings, which NumPy parses in one vectorized pass with no format guessing. Anything
+    else goes through pd.to_datetime with DATE_FORMAT spelled out, so a date in the wrong format raises instead of
+    slipping through as a string.
     
-    #same as above 
-    if end_date:
-        end_date = pd.to_datetime(end_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        end_date = date.today()
+    values: the dates, as strings
+    source: 'boj' or 'jse'. The BAD_DATES of that source get False in the mask.
     
-    data = pd.read_html(f"""https://www.jamstockex.com/market-data/download-data/price-history/{ticker}/{start_date}/{end_date}""") #The Jamaica Stock Exchange has a pattern with how they store their data. I found that pattern, as such, I'm leveraging it. This line scrapes the data from the JSE and tries to return it as a dataframe.
+    Returns the index (every date, in the same order) and a boolean mask of the rows to keep.
     
-    data = data[0] #The data wasn't returned as a dataframe, instead, it was returned as an array with one element: the data. This line indexes into the array amd accesses the data.
+    """
+    values = np.asarray(values)
+    try:
+        days = values.astype('datetime64[D]')
+    except ValueError:
+        days = pd.to_datetime(values, format=DATE_FORMAT).to_numpy()
+    
+    index = pd.DatetimeIndex(days.astype('datetime64[ns]'), name='Date')
+    keep = ~index.isin(np.array(BAD_DATES.get(source, []), dtype='datetime64[ns]'))
+    return index, keep
+
+
+def business_days(start, end):
+    """
+    The Monday to Friday dates from start to end (both included), as a slice of one calendar index that is built once
+    and shared by every caller, so lining series up or checking for missing days doesn't build a new date range each time.
     
-    del data['Unnamed: 0'] #deletes an unnecessary row
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    calendar = _calendar(min(start.year, 1990), max(end.year, 2040))
+    return calendar[calendar.searchsorted(start):calendar.searchsorted(end, side='right')]
+
+
+@lru_cache(maxsize=None)
+def _calendar(first_year, last_year):
+    return pd.bdate_range(f'{first_year}-01-01', f'{last_year}-12-31', name='Date').as_unit('ns') #same unit as the parsed dates
+
+
+@_traced('parse html', before=lambda page, index=0: {'bytes': len(page)}, after=lambda table: {'rows': len(table)})
+def _read_table(page, index = 0):
+    """
+    Pulls one table out of an html page, like pd.read_html(page)[index], without building every other table on the page.
     
-    data.index = data['Date'] #assigns the "Date" column as the index
+    The page is streamed through lxml's pull parser: the tables before the one we want are skipped, the parse stops as soon
+    as the wanted table is closed, and every row is thrown away once its cells have been read. The cell texts are packed
+    into NumPy string blocks as we go, and each column then comes out as one typed array (int64 or float64 when every
+    cell is a number, text otherwise) instead of going through pandas' type inference cell by cell.
     
-    del data['Date'] #deletes the row
+    Header rows (the <thead>, or the leading rows made only of <th> cells) become the column names, with colspans
+    spread out and whitespace tidied the same way read_html does it, so the loaders can index the result just like
+    before. Rowspans are not expanded, the BoJ and JSE tables don't use them.
     
-    data.index = pd.to_datetime(data.index) #transforms the dates into a datetime object. Most libraries need the index to be a datetime object, so that's why this was done.
+    page: the html, as bytes or str
+    index: which table to return, counting every <table> on the page in document order (nested ones included)
     
-    for i, b in enumerate(data.columns.values):
-        data.columns.values[i] = b.replace(" ($)", "").replace("  ", " ") #The titles of the columns aren't formatted properly, so these lines correct that.
+    """
+    
+    from lxml import etree #only needed when a page gets parsed
+    
+    encoding = None #for bytes, lxml works it out from the page itself
+    if isinstance(page, str):
+        page, encoding = page.encode(), 'utf-8'
+    
+    parser = etree.HTMLPullParser(events=('start', 'end'), tag=('table', 'tr'), encoding=encoding)
+    tables = -1 #how many <table> tags we have gone into so far
+    depth = 0 #how deep inside the wanted table we are, 0 means we're not in it
+    header, rows, blocks = [], [], []
+    done = False
+    
+    for offset in range(0, len(page), 1 << 16): #the page is fed in 64kB pieces, so we can stop reading once we have the table
+        parser.feed(page[offset:offset + (1 << 16)])
         
-    data = data.dropna(axis=1) #removes all the columns that don't have useful values
+        for event, elem in parser.read_events():
+            if elem.tag == 'table':
+                if event == 'start':
+                    tables += 1
+                    if depth or tables == index:
+                        depth += 1
+                elif depth:
+                    depth -= 1
+                    if not depth:
+                        done = True #that was the end of the table we wanted
+                        break
+            
+            elif event == 'end':
+                if depth == 1: #rows of tables nested inside the wanted one are left out, like read_html does
+                    row = [((cell.text or '') if not len(cell) else ''.join(cell.itertext()), cell.get('colspan'), cell.tag) for cell in elem if cell.tag in ('td', 'th')]
+                    if row and (elem.getparent().tag == 'thead' or (not rows and not blocks and all(tag == 'th' for _, _, tag in row))):
+                        header.append([_tidy(text) for text, span, _ in row for _ in range(int(span or 1))])
+                    elif row:
+                        rows.append([text for text, span, _ in row for _ in range(int(span or 1))] if any(span for _, span, _ in row) else [text for text, _, _ in row])
+                        if len(rows) == 4096:
+                            blocks.append(_text_block(rows))
+                            rows = []
+                
+                if depth <= 1:
+                    elem.clear() #the rows we're done with are dropped straight away, so memory doesn't grow with the page
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+        
+        if done:
+            break
     
-    data = data['Close Price'] 
-    data = data.pct_change()
+    if tables < index:
+        raise MissingTableError(f'The page only has {tables + 1} tables')
     
-    return data #returns the datarame to the user 
+    blocks.append(_text_block(rows))
+    width = max([block.shape[1] for block in blocks] + [len(r) for r in header])
+    blocks = [_pad(block, width) for block in blocks]
+    
+    names = [r + [''] * (width - len(r)) for r in header]
+    if len(names) > 1:
+        columns = pd.MultiIndex.from_arrays([[name or f'Unnamed: {i}_level_{level}' for i, name in enumerate(level_names)] for level, level_names in enumerate(names)])
+    elif names:
+        columns = [name or f'Unnamed: {i}' for i, name in enumerate(names[0])]
+    else:
+        columns = list(range(width))
+    
+    return pd.DataFrame({i: _typed_column(np.concatenate([block[:, i] for block in blocks])) for i in range(width)}).set_axis(columns, axis=1)
 
-########################################################################################
 
-def get_stock_report(ticker, start_date = '2000-01-01', end_date = date.today()):
+class MissingTableError(ValueError):
+    """Raised by the loaders when the page doesn't have the table. The sites send back such a page when there's nothing in the date range."""
+
+
+def _tidy(text):
+    #read_html turns line breaks and runs of 2+ spaces into one space, so we do the same
+    return re.sub(r'[\r\n]+|\s{2,}', ' ', text).strip()
+
+
+def _text_block(rows):
+    #packs a batch of rows into a 2-D array of strings: 1 byte per character when the text is plain ascii (numbers and dates), 4 otherwise
+    width = max([len(r) for r in rows] + [0])
+    rows = [r + [''] * (width - len(r)) if len(r) < width else r for r in rows]
+    try:
+        return np.array(rows, dtype=bytes).reshape(len(rows), width)
+    except UnicodeEncodeError:
+        return np.array(rows, dtype=str).reshape(len(rows), width)
+
+
+def _pad(block, width):
+    return np.concatenate([block, np.full((len(block), width - block.shape[1]), '', dtype=block.dtype)], axis=1)
+
+
+def _typed_column(cells):
+    #turns one column of cell texts into an int64 or float64 array if every cell is a number (blanks become NaN), and leaves it as text otherwise
+    empty = cells.dtype.type('')
+    cells = np.char.strip(cells)
+    blank = (cells == empty) | (cells == cells.dtype.type('-'))
+    try:
+        values = np.where(blank, cells.dtype.type('nan'), np.char.replace(cells, cells.dtype.type(','), empty)).astype(np.float64)
+    except ValueError:
+        text = np.array([_tidy(t.decode() if isinstance(t, bytes) else t) for t in cells], dtype=object)
+        text[blank] = np.nan
+        return text
+    if not blank.any() and len(values) and np.all(values == np.round(values)) and np.all(np.char.find(cells, cells.dtype.type('.')) < 0):
+        return values.astype(np.int64)
+    return values
+
+
+@_traced('get_jse_data', before=lambda ticker, *args, **kwargs: {'ticker': ticker})
+def get_jse_data(ticker, start_date = '2000-01-01', end_date = None, store = None, session = None):
     """
-    This aim of this function is to scrape stock data from the Jamaica Stock Exchange and then give a report on the stock's performance and visualize some key metrics about the stock: Cumulative Return, Drawdown and Daily Return. 
+    This aim of this function is to scrape stock data from the Jamaica Stock Exchange. 
     
     ticker: Enter the ticker of the stock you wish to analyze
     start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
     end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+    store: optional HistoryStore. If you pass one, only the days after the last stored row get downloaded and the rest is read from disk.
+           A start_date before the stored history downloads it again from that date.
+    session: optional DataSession. If you pass one, asking for the same ticker and dates again doesn't download anything.
     
     """
     
-    ticker = ticker.upper() #Ensures that all the letters of the ticker are capitalized. This is to ensure that the code doesn't get any errors later on, since tickers are normallt all caps.
+    ticker = ticker.upper() #Ensures that all the letters of the ticker are capitalized. This is to ensure that the code doesn't get any errors later on, since tickers are normally all caps.
     
-    #Catches an error if the user forgets to input the start date and uses of the fault value of January 1, 2017.
-    if start_date:
-        start_date = pd.to_datetime(start_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        start_date = '2000-01-01'
+    if session is not None:
+        return session.get(('jse', ticker, str(start_date), str(end_date or date.today())), lambda: get_jse_data(ticker, start_date, end_date, store))
+    
+    if store is not None:
+        data = store.refresh('jse', ticker, lambda start: get_jse_data(ticker, start), start_date or '2000-01-01', end_date)
+        return data.loc[pd.Timestamp(start_date or '2000-01-01'):pd.Timestamp(end_date or date.today())]
+    
+    #Catches an error if the user forgets to input the start date and uses of the fault value of January 1, 2000.
+    start_date = _format_date(start_date or '2000-01-01') #formats the date
     
     #same as above 
-    if end_date:
-        end_date = pd.to_datetime(end_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        end_date = date.today()
+    end_date = _format_date(end_date or date.today()) #formats the date
     
-    data = pd.read_html(f"""https://www.jamstockex.com/market-data/download-data/price-history/{ticker}/{start_date}/{end_date}""") #The Jamaica Stock Exchange has a pattern with how they store their data. I found that pattern, as such, I'm leveraging it. This line scrapes the data from the JSE and tries to return it as a dataframe.
+    data = _read_table(_fetch_page(JSE_URL.format(ticker=ticker, start_date=start_date, end_date=end_date)), 0) #This line scrapes the data from the JSE and returns the (only) table on the page as a dataframe.
     
-    data = data[0] #The data wasn't returned as a dataframe, instead, it was returned as an array with one element: the data. This line indexes into the array amd accesses the data.
+    return _clean_jse_table(data).loc[start_date:end_date] #returns the datarame to the user (a replayed page can start earlier, see FixtureStore)
+
+
+@_traced('clean jse table', after=lambda data: {'rows': len(data)})
+def _clean_jse_table(data):
     
     del data['Unnamed: 0'] #deletes an unnecessary row
     
@@ -130,68 +573,211 @@ def get_stock_report(ticker, start_date = '2000-01-01', end_date = date.today())
     
     del data['Date'] #deletes the row
     
-    data.index = pd.to_datetime(data.index) #transforms the dates into a datetime object. Most libraries need the index to be a datetime object, so that's why this was done.
+    index, keep = _parse_dates(data.index, 'jse') #transforms the dates into a datetime object. Most libraries need the index to be a datetime object, so that's why this was done.
+    data = data.set_axis(index)[keep]
+    data = data[::-1] if data.index.is_monotonic_decreasing else data.sort_index() #the site lists the newest day first. Oldest first is what pct_change and the stored histories expect
     
     for i, b in enumerate(data.columns.values):
         data.columns.values[i] = b.replace(" ($)", "").replace("  ", " ") #The titles of the columns aren't formatted properly, so these lines correct that.
         
     data = data.dropna(axis=1) #removes all the columns that don't have useful values
     
-    data = data['Close Price'] 
-    data = data.pct_change()
-    
-    return qs.reports.basic(data)
+    return data
 
-##############################################################################################
+####################################################################################################
 
-def get_stock_report_full(ticker, start_date = '2000-01-01', end_date = date.today()):
+@_traced('get_jse_data_many', before=lambda tickers, *args, **kwargs: {'tickers': len(tickers)})
+def get_jse_data_many(tickers, start_date = '2000-01-01', end_date = None, field = 'Close Price', how = 'wide',
+                      max_workers = 8, requests_per_second = 4, retries = 3, backoff = 0.5, errors = 'raise', base_url = JSE_URL):
     """
-    This aim of this function is to scrape stock data from the Jamaica Stock Exchange and then give a full report on the stock's performance, with the S&P500 as a benchmark.
+    Downloads the price history of many JSE tickers at the same time, instead of one after the other like get_jse_data.
+    
+    The downloads run in a thread pool and share one keep-alive connection pool. Requests to the same host are spaced
+    out so that we stay under requests_per_second, and a failed request is retried with an exponential backoff.
+    
+    tickers: list of the tickers you wish to analyze
+    start_date, end_date: in the format 'yyyy-mm-dd'. The default end date is today.
+    field: the column to keep when how='wide'
+    how: 'wide' gives one column per ticker (field only), on one date index shared by every ticker.
+         'long' gives every column, stacked with a (Ticker, Date) index.
+    max_workers: how many downloads run at the same time
+    requests_per_second: the most requests we send to one host per second
+    retries: how many times a failed download is tried again
+    backoff: seconds to wait before the first retry. The wait doubles on every retry.
+    errors: 'raise' stops at the first ticker that still fails after the retries, 'ignore' warns and leaves it out,
+            so an empty frame comes back if every ticker fails.
+    base_url: the url pattern to download from, with {ticker}, {start_date} and {end_date} in it. Point it at a local server to test.
     
-    ticker: Enter the ticker of the stock you wish to analyze
-    start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
-    end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+    """
     
+    import requests #only needed here, so it isn't imported with the rest of the module
+    from requests.adapters import HTTPAdapter
+    
+    tickers = [ticker.upper() for ticker in tickers]
+    start_date = _format_date(start_date or '2000-01-01')
+    end_date = _format_date(end_date or date.today())
+    
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    limiter = _RateLimiter(requests_per_second)
+    
+    def download(ticker):
+        url = base_url.format(ticker=ticker, start_date=start_date, end_date=end_date)
+        if not isinstance(_source, LiveSource): #recording or replaying, so the page goes through the source like in get_jse_data
+            return _clean_jse_table(_read_table(_fetch_page(url), 0)).loc[start_date:end_date]
+        for attempt in range(retries + 1):
+            limiter.wait(urlsplit(url).netloc)
+            try:
+                with _span('fetch', url=url) as span:
+                    response = http.get(url, timeout=30)
+                    span.set(bytes=len(response.content))
+                if response.status_code == 429 or response.status_code >= 500: #only these are worth trying again
+                    raise requests.HTTPError(f'{response.status_code} Error for url: {url}', response=response)
+            except requests.RequestException:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2**attempt)
+                continue
+            response.raise_for_status()
+            return _clean_jse_table(_read_table(response.content, 0))
+    
+    frames = {}
+    with http, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for ticker, future in [(ticker, pool.submit(download, ticker)) for ticker in tickers]:
+            try:
+                frames[ticker] = future.result()
+            except Exception as e:
+                if errors == 'raise':
+                    raise
+                warnings.warn(f'Could not download {ticker}: {e}')
+    
+    if not frames: #no tickers, or none of them could be downloaded with errors='ignore'
+        dates = pd.DatetimeIndex([], name='Date')
+        if how == 'long':
+            return pd.DataFrame(index=pd.MultiIndex.from_arrays([pd.Index([], dtype=object), dates], names=['Ticker', 'Date']))
+        return pd.DataFrame(index=dates)
+    
+    if how == 'long':
+        return pd.concat(frames, names=['Ticker', 'Date'])
+    return pd.concat({ticker: frame[field] for ticker, frame in frames.items()}, axis=1).sort_index()
+
+
+class _RateLimiter:
+    #spaces out requests to the same host so that there are at most `rate` of them per second, across all the threads
+    
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = {}
+        self.lock = threading.Lock()
+    
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time.get(host, now))
+            self.next_time[host] = slot + self.interval
+        time.sleep(slot - now)
+
+####################################################################################################
+
+class JSEStock:
     """
+    One JSE ticker, downloaded once. Everything else is worked out from that one download, and only when it is asked for:
     
-    ticker = ticker.upper() #Ensures that all the letters of the ticker are capitalized. This is to ensure that the code doesn't get any errors later on, since tickers are normallt all caps.
+        raw page -> clean price table (prices) -> daily returns (returns) -> reports (report, report_full)
     
-    #Catches an error if the user forgets to input the start date and uses of the fault value of January 1, 2017.
-    if start_date:
-        start_date = pd.to_datetime(start_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        start_date = '2000-01-01'
+    So asking for the prices, the returns and a report of the same stock costs one download instead of three.
     
-    #same as above 
-    if end_date:
-        end_date = pd.to_datetime(end_date, format='%Y%m%d', errors='ignore') #formats the date
-    else:
-        end_date = date.today()
+    ticker, start_date, end_date, store, session: same as in get_jse_data
     
-    data = pd.read_html(f"""https://www.jamstockex.com/market-data/download-data/price-history/{ticker}/{start_date}/{end_date}""") #The Jamaica Stock Exchange has a pattern with how they store their data. I found that pattern, as such, I'm leveraging it. This line scrapes the data from the JSE and tries to return it as a dataframe.
+    """
     
-    data = data[0] #The data wasn't returned as a dataframe, instead, it was returned as an array with one element: the data. This line indexes into the array amd accesses the data.
+    def __init__(self, ticker, start_date = '2000-01-01', end_date = None, store = None, session = None):
+        self.ticker = ticker.upper()
+        self.start_date = start_date
+        self.end_date = end_date
+        self.store = store
+        self.session = session
+    
+    @cached_property
+    def prices(self):
+        return get_jse_data(self.ticker, self.start_date, self.end_date, self.store, self.session)
+    
+    @cached_property
+    def returns(self):
+        return self.prices['Close Price'].pct_change()
+    
+    @_traced('JSEStock.report')
+    def report(self):
+        import quantstats as qs #only needed for the reports, and slow to import (it brings matplotlib, seaborn and scipy along)
+        return qs.reports.basic(self.returns)
+    
+    @_traced('JSEStock.report_full')
+    def report_full(self, benchmark = 'SPY'):
+        import quantstats as qs
+        if isinstance(benchmark, str) and self.store is not None:
+            benchmark = get_benchmark_returns(benchmark, self.store) #read from disk instead of downloaded on every report
+        return qs.reports.metrics(self.returns, benchmark=benchmark, mode="full")
+    
+    @_traced('JSEStock.metrics')
+    def metrics(self, benchmark = None):
+        return report_metrics(self.returns.to_frame(self.ticker), benchmark).loc[self.ticker]
+
+####################################################################################################
+
+@_traced('get_jse_data_daily_returns')
+def get_jse_data_daily_returns(ticker, start_date = '2000-01-01', end_date = None, store = None, session = None):
+    """
+    This aim of this function is to scrape stock data from the Jamaica Stock Exchange and return the daily returns of the stock.
     
-    del data['Unnamed: 0'] #deletes an unnecessary row
+    ticker: Enter the ticker of the stock you wish to analyze
+    start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
+    end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+    store: optional HistoryStore, same as in get_jse_data.
+    session: optional DataSession, same as in get_jse_data.
     
-    data.index = data['Date'] #assigns the "Date" column as the index
+    """
     
-    del data['Date'] #deletes the row
+    return JSEStock(ticker, start_date, end_date, store, session).returns
+
+########################################################################################
+
+@_traced('get_stock_report')
+def get_stock_report(ticker, start_date = '2000-01-01', end_date = None, store = None, session = None):
+    """
+    This aim of this function is to scrape stock data from the Jamaica Stock Exchange and then give a report on the stock's performance and visualize some key metrics about the stock: Cumulative Return, Drawdown and Daily Return. 
     
-    data.index = pd.to_datetime(data.index) #transforms the dates into a datetime object. Most libraries need the index to be a datetime object, so that's why this was done.
+    ticker: Enter the ticker of the stock you wish to analyze
+    start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
+    end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+    store: optional HistoryStore, same as in get_jse_data.
+    session: optional DataSession, same as in get_jse_data.
     
-    for i, b in enumerate(data.columns.values):
-        data.columns.values[i] = b.replace(" ($)", "").replace("  ", " ") #The titles of the columns aren't formatted properly, so these lines correct that.
-        
-    data = data.dropna(axis=1) #removes all the columns that don't have useful values
+    """
+    
+    return JSEStock(ticker, start_date, end_date, store, session).report()
+
+##############################################################################################
+
+@_traced('get_stock_report_full')
+def get_stock_report_full(ticker, start_date = '2000-01-01', end_date = None, store = None, session = None):
+    """
+    This aim of this function is to scrape stock data from the Jamaica Stock Exchange and then give a full report on the stock's performance, with the S&P500 as a benchmark.
     
-    data = data['Close Price'] 
-    data = data.pct_change()
+    ticker: Enter the ticker of the stock you wish to analyze
+    start_date: in the format 'yyyy-mm-dd', enter the starting date if the data you want.
+    end_date: The default end date is today (yes, I coded it to be dynamic). If you want a special date, enter that date in the format 'yyy-mm-dd'.
+    store: optional HistoryStore, same as in get_jse_data.
+    session: optional DataSession, same as in get_jse_data.
     
-    return qs.reports.metrics(data, benchmark='SPY', mode="full")
+    """
+    
+    return JSEStock(ticker, start_date, end_date, store, session).report_full()
 
 ####################################################################################################################
 
+@_traced('drawdown', after=lambda result: {'rows': len(result)})
 def drawdown(return_series: pd.Series):
     """Takes a time series of asset returns.
        returns a DataFrame with columns for
@@ -206,364 +792,1627 @@ def drawdown(return_series: pd.Series):
                          "Previous Peak": previous_peaks, 
                          "Drawdown": drawdowns})
 
-####################################################################################################################
 
-def get_fx_rates():
+@_traced('drawdown_many', before=lambda returns, *args, **kwargs: {'rows': returns.size})
+def drawdown_many(returns, dtype = np.float64):
+    """Takes a DataFrame (or 2-D array) of returns, one column per asset.
+       Works out everything drawdown() does for every column at once, plus a summary of each column's drawdowns.
+       Missing returns are treated as a day with no change.
+       
+       dtype: np.float32 halves the memory when there are thousands of columns
+       
+       returns a tuple of four DataFrames:
+       the wealth index, 
+       the previous peaks, 
+       the percentage drawdown, and
+       a summary with one row per column: the max drawdown, the dates of the peak before it, of its bottom and of the
+       recovery (NaT if it hasn't recovered yet), the longest drawdown and the current one, in periods
+    """
+    index = returns.index if isinstance(returns, pd.DataFrame) else pd.RangeIndex(len(returns))
+    columns = returns.columns if isinstance(returns, pd.DataFrame) else pd.RangeIndex(np.shape(returns)[1])
+    returns = np.nan_to_num(np.asarray(returns, dtype=dtype))
+    n, k = returns.shape
+    
+    wealth, peaks, drawdowns, duration = _drawdown_pass(returns, np.full(k, 1000, dtype=dtype), np.zeros(k, dtype=dtype), np.zeros(k, dtype=np.int64))
+    
+    rows = np.arange(n)[:, None]
+    trough = drawdowns.argmin(axis=0)
+    peak = np.maximum.accumulate(np.where(drawdowns < 0, 0, rows), axis=0)[trough, np.arange(k)]
+    recovery = np.where((drawdowns >= 0) & (rows > trough) & (drawdowns[trough, np.arange(k)] < 0), rows, n).min(axis=0) #n means it hasn't recovered (or never dropped)
+    
+    dates = pd.Series(index)
+    summary = pd.DataFrame({'Max Drawdown': drawdowns.min(axis=0),
+                            'Peak Date': dates.reindex(peak).to_numpy(),
+                            'Trough Date': dates.reindex(trough).to_numpy(),
+                            'Recovery Date': dates.reindex(recovery).to_numpy(),
+                            'Longest Drawdown': duration.max(axis=0),
+                            'Current Drawdown': duration[-1]}, index=columns)
+    
+    return (pd.DataFrame(wealth, index=index, columns=columns, copy=False),
+            pd.DataFrame(peaks, index=index, columns=columns, copy=False),
+            pd.DataFrame(drawdowns, index=index, columns=columns, copy=False),
+            summary)
+
+
+def _drawdown_pass(returns, wealth, peak, duration):
+    #one vectorized pass over a (dates x assets) block of returns, carrying on from the given wealth, peak and drawdown length of each asset
+    wealth = wealth * np.cumprod(1 + returns, axis=0)
+    peaks = np.maximum(np.maximum.accumulate(wealth, axis=0), peak)
+    drawdowns = (wealth - peaks)/peaks
+    
+    rows = np.arange(1, len(returns) + 1)[:, None]
+    last_peak = np.maximum.accumulate(np.where(drawdowns < 0, 0, rows), axis=0) #the last row that was at a peak, 0 if there was none in this block
+    duration = np.where(last_peak == 0, duration + rows, rows - last_peak)
+    return wealth, peaks, drawdowns, duration
+
+
+class DrawdownMonitor:
+    """
+    Keeps track of the drawdowns of many assets as new returns come in, without holding on to their history.
+    
+    Only the latest wealth, peak, drawdown length and worst drawdown of each asset are kept, so an update costs the same
+    whether we have one year of history or twenty. Feed it the history once, then every new day (or block of days).
+    
+    columns: the names of the assets
+    dtype: np.float32 halves the memory when there are thousands of assets
     
-    today = date.today()
-    data = pd.read_html(f'http://www.boj.org.jm/foreign_exchange/searchfx.php?iAll=1&iUSD=1&iGBP=1&iCAD=1&iEUR=1&rate=1&strFromDate=2000-01-01&strToDate={today}&Enter=')
-    fx= data[3]
+    """
     
-    dates = []
+    def __init__(self, columns, dtype = np.float64):
+        self.columns = pd.Index(columns)
+        self.dtype = dtype
+        k = len(self.columns)
+        self.wealth = np.full(k, 1000, dtype=dtype)
+        self.peak = np.zeros(k, dtype=dtype)
+        self.max_drawdown = np.zeros(k, dtype=dtype)
+        self.duration = np.zeros(k, dtype=np.int64)
+        self.longest = np.zeros(k, dtype=np.int64)
+    
+    def update(self, new_returns):
+        """Takes the returns of one day (one value per asset) or of several days (a 2-D block), and returns the current drawdowns."""
+        if isinstance(new_returns, (pd.Series, pd.DataFrame)):
+            new_returns = new_returns.reindex(self.columns, axis=-1 if new_returns.ndim == 1 else 1)
+        returns = np.nan_to_num(np.asarray(new_returns, dtype=self.dtype)).reshape(-1, len(self.columns))
+        
+        if len(returns):
+            wealth, peaks, drawdowns, duration = _drawdown_pass(returns, self.wealth, self.peak, self.duration)
+            self.wealth, self.peak, self.duration = wealth[-1], peaks[-1], duration[-1]
+            self.max_drawdown = np.minimum(self.max_drawdown, drawdowns.min(axis=0))
+            self.longest = np.maximum(self.longest, duration.max(axis=0))
+        
+        return self.drawdown
+    
+    @property
+    def drawdown(self):
+        return pd.Series((self.wealth - self.peak)/self.peak, index=self.columns)
+    
+    def summary(self):
+        return pd.DataFrame({'Wealth': self.wealth,
+                             'Previous Peak': self.peak,
+                             'Drawdown': (self.wealth - self.peak)/self.peak,
+                             'Max Drawdown': self.max_drawdown,
+                             'Longest Drawdown': self.longest,
+                             'Current Drawdown': self.duration}, index=self.columns)
 
-    for i in range(0,len(fx), 2):
-        dates.append(fx.iloc[i][0])
-     
-    dates=dates[::-1]
-    for i in range(0,len(fx), 2):
-        fx = fx.drop([i], axis=0)
+####################################################################################################################
+
+@_traced('report_metrics', before=lambda returns, *args, **kwargs: {'rows': returns.size})
+def report_metrics(returns, benchmark = None, rf = 0.0, periods = 252, plot = False):
+    """
+    Works out the core numbers of a performance report for a whole panel of return series at once, with no network
+    access and no plots (unless you ask for them). It is meant for nightly reports over every JSE ticker, where calling
+    quantstats once per ticker is far too slow.
+    
+    returns: DataFrame of returns, one column per ticker (a Series works too)
+    benchmark: optional Series of benchmark returns, e.g. from get_benchmark_returns. Adds beta, alpha and correlation.
+    rf: the yearly risk free rate, used for the Sharpe and Sortino ratios
+    periods: how many returns there are in a year
+    plot: if True, also plots the cumulative returns
+    
+    Returns one row per ticker: cumulative return, CAGR, yearly volatility, Sharpe, Sortino, max drawdown and
+    (with a benchmark) beta, yearly alpha and correlation. Missing returns are skipped.
+    
+    """
+    
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    r = returns.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(r)
+    count = valid.sum(axis=0)
+    
+    growth = np.nanprod(1 + r, axis=0)
+    excess = r - rf/periods
+    mean = np.nanmean(excess, axis=0)
+    downside = np.sqrt(np.nansum(np.minimum(excess, 0)**2, axis=0)/count)
+    
+    metrics = pd.DataFrame({'Start Period': returns.apply(pd.Series.first_valid_index),
+                            'End Period': returns.apply(pd.Series.last_valid_index),
+                            'Cumulative Return': growth - 1,
+                            'CAGR': growth**(periods/count) - 1,
+                            'Volatility (ann.)': np.nanstd(r, axis=0, ddof=1)*np.sqrt(periods),
+                            'Sharpe': mean/np.nanstd(excess, axis=0, ddof=1)*np.sqrt(periods),
+                            'Sortino': mean/downside*np.sqrt(periods),
+                            'Max Drawdown': drawdown_many(returns)[3]['Max Drawdown'].to_numpy()}, index=returns.columns)
+    
+    if benchmark is not None:
+        b = benchmark.reindex(returns.index).to_numpy(dtype=np.float64)[:, None]
+        both = valid & ~np.isnan(b) #each ticker is compared with the benchmark over the days they both have
+        n = both.sum(axis=0)
+        r_mean, b_mean = np.where(both, r, 0).sum(axis=0)/n, np.where(both, b, 0).sum(axis=0)/n
+        r_dev, b_dev = np.where(both, r - r_mean, 0), np.where(both, b - b_mean, 0)
+        cov = (r_dev*b_dev).sum(axis=0)/(n - 1)
+        b_var, r_var = (b_dev**2).sum(axis=0)/(n - 1), (r_dev**2).sum(axis=0)/(n - 1)
         
-    del fx[('Date', 'Unnamed: 0_level_1')]
+        metrics['Beta'] = cov/b_var
+        metrics['Alpha (ann.)'] = (r_mean - metrics['Beta'].to_numpy()*b_mean)*periods
+        metrics['Correlation'] = cov/np.sqrt(b_var*r_var)
     
-    usd_buy = list(fx[('USD', 'BUY')])[::-1]
-    usd_buy = [round(float(i), 2) for i in usd_buy]
+    if plot:
+        (1 + returns.fillna(0)).cumprod().sub(1).plot(figsize=(16, 8), title='Cumulative Return')
+    
+    return metrics
 
-    gbp_buy = list(fx[('GBP', 'BUY')])[::-1]
-    gbp_buy = [round(float(i), 2) for i in gbp_buy]
 
-    cad_buy = list(fx[('CAD', 'BUY')])[::-1]
-    cad_buy = [round(float(i), 2) for i in cad_buy]
+@_traced('get_benchmark_returns')
+def get_benchmark_returns(ticker = 'SPY', store = None):
+    """
+    Returns the daily returns of a benchmark (the S&P500 ETF by default) from Yahoo Finance. With a HistoryStore, the
+    prices are kept on disk and only the missing days get downloaded, so reports don't need the network every time.
+    
+    """
+    
+    def fetch(start_date):
+        import yfinance as yf #comes with quantstats, only needed here
+        prices = yf.download(ticker, start=start_date, auto_adjust=True, progress=False, multi_level_index=False)
+        return prices[['Close']]
+    
+    prices = fetch('2000-01-01') if store is None else store.refresh('benchmark', ticker, fetch)
+    return prices['Close'].pct_change().rename(ticker)
 
-    eur_buy = list(fx[('EUR', 'BUY')])[::-1]
-    eur_buy = [round(float(i), 2) for i in eur_buy]
+####################################################################################################################
 
-    usd_sell = list(fx[('USD', 'SELL')])[::-1]
-    usd_sell = [round(float(i), 2) for i in usd_sell]
+@_traced('get_fx_rates')
+def get_fx_rates(store = None, session = None):
+    """
+    Scrapes the daily buy and sell rates of the USD, GBP, CAD and EUR from the Bank of Jamaica.
+    
+    store: optional HistoryStore. If you pass one, only the days after the last stored row get downloaded and the rest is read from disk.
+    session: optional DataSession. If you pass one, calling this again doesn't download anything until the session's ttl runs out.
+    
+    """
+    
+    if session is not None:
+        return session.get(('boj', str(date.today())), lambda: get_fx_rates(store))
+    
+    if store is not None:
+        return store.refresh('boj', 'fx_rates', _fetch_fx_rates)
+    
+    return _fetch_fx_rates('2000-01-01')
 
-    gbp_sell = list(fx[('GBP', 'SELL')])[::-1]
-    gbp_sell = [round(float(i), 2) for i in gbp_sell]
 
-    cad_sell = list(fx[('CAD', 'SELL')])[::-1]
-    cad_sell = [round(float(i), 2) for i in cad_sell]
+def _fetch_fx_rates(start_date):
+    
+    fx = _read_table(_fetch_page(BOJ_URL.format(start_date=start_date, end_date=date.today())), 3)
+    
+    with _span('reshape fx table', rows=len(fx)):
+        dates = fx.iloc[0::2, 0].to_numpy()[::-1] #the table alternates a row with the date and a row with the rates, newest first
+        
+        columns = [tuple(name.split()) for name in FX_SERIES]
+        values = _round(fx.iloc[1::2][columns].to_numpy(dtype=float)[::-1], 2) #one conversion and rounding for the whole table
+        
+    with _span('parse dates', rows=len(dates)):
+        index, keep = _parse_dates(dates, 'boj')
+    
+    fx_data = pd.DataFrame(values[keep], index=index[keep], columns=FX_SERIES)
+    
+    return fx_data
+###################################################################################################
+
+FX_SERIES = ['USD BUY', 'USD SELL', 'GBP BUY', 'GBP SELL', 'CAD BUY', 'CAD SELL', 'EUR BUY', 'EUR SELL'] #order of the currency/side columns in the BoJ table
+FX_FIELDS = ['Exchange Rate', 'Volume Traded', 'High', 'Low', '10 Day MA'] #order of the rows under each date in the BoJ table
 
-    eur_sell = list(fx[('EUR', 'SELL')])[::-1]
-    eur_sell = [round(float(i), 2) for i in eur_sell]
+
+@_traced('reshape full fx table', before=lambda data: {'rows': len(data)})
+def _parse_full_fx_table(data):
+    """
+    The BoJ table stores every date as a block of 6 rows: the date itself, then the rate, volume, high, low and 10 day MA,
+    with one column per currency/side. Instead of walking the blocks row by row, this reshapes the whole table into a
+    (dates x fields x series) array in one go and hands back one frame per series, in the same order as FX_SERIES.
     
+    data: the raw table, as returned by _read_table (or pd.read_html)
     
-    forex = {'USD BUY': usd_buy,
-             'USD SELL': usd_sell,
-             'GBP BUY': gbp_buy,
-             'GBP SELL': gbp_sell,
-             'CAD BUY': cad_buy,
-             'CAD SELL': cad_sell,
-             'EUR BUY': eur_buy,
-             'EUR SELL': eur_sell
-          }
+    """
     
-    fx_data = pd.DataFrame.from_dict(forex)
+    index, values = _full_fx_values(data)
     
-    fx_data.index = dates
+    values = values.transpose(2, 0, 1).copy() #(series x dates x fields), so that each series is one contiguous slice
     
-    fx_data.index = pd.to_datetime(fx_data.index.values, format='%Y%m%d', errors='ignore')
+    return tuple(pd.DataFrame(values[k], index=index, columns=FX_FIELDS, copy=False) for k in range(len(FX_SERIES)))
+
+
+def _full_fx_values(data):
+    #the shared date index and a (dates x fields x series) array of the rounded values, oldest first
     
-    fx_data = fx_data.drop(index='2020-09-03')
+    n_dates = len(data) // 6 #every date takes up 6 rows
     
-    return fx_data
-###################################################################################################
+    date = data.iloc[0:n_dates*6:6, 0].to_numpy()[::-1] #the first row of each block holds the date. The table is newest first, so it gets flipped
+    
+    values = data.iloc[:n_dates*6, 1:1+len(FX_SERIES)].to_numpy(dtype=float) #one float conversion for the whole table instead of one per cell
+    values = values.reshape(n_dates, 6, len(FX_SERIES))[::-1, 1:, :] #(dates x fields x series), oldest first, with the date rows dropped
+    
+    with _span('parse dates', rows=len(date)):
+        index, keep = _parse_dates(date, 'boj') #the dates are shared by every series, so they only get parsed (and the bad ones dropped) once
+    
+    values = values[keep] #a copy, so it can be rounded in place
+    return index[keep], _round(values, 2, out=values)
+
+
+def _round(values, decimals = 2, out = None):
+    """
+    Rounds every value exactly like round(float(v), decimals) does, for a whole array at once. np.round multiplies by
+    10**decimals and rounds what comes out, which is off by a cent on some half-cent values (2.675 -> 2.68 where
+    round gives 2.67) because the multiplication itself rounds. Only the values whose product lands within an ulp of a
+    half can go wrong, so those few are redone with the exact error of the multiplication (Dekker's trick) and the
+    halfway cases are decided on the true value, ties going to even like round does.
+    
+    The values are done in blocks of about 64k along the first axis, so the temporaries stay the same small size however
+    big the table is.
+    out: an array to write the result to. Pass values itself to round in place.
+    
+    """
+    scale = 10.0**decimals
+    values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+    out = np.empty(values.shape) if out is None else out
+    rows = max(1, (1 << 16)*len(values)//max(values.size, 1)) #how many rows along the first axis make a block
+    
+    with np.errstate(invalid='ignore', over='ignore'):
+        for start in range(0, len(values), rows):
+            x = values[start:start + rows].ravel() #only a block gets copied when the array isn't contiguous
+            product = x*scale
+            rounded = np.rint(product)
+            near = np.flatnonzero(np.abs(np.abs(product - rounded) - 0.5) <= np.spacing(np.abs(product)))
+            
+            if len(near):
+                v, p = x[near], product[near]
+                split = v*134217729.0 #2**27 + 1: high keeps the top 26 bits of each value, so high*scale and (v - high)*scale are exact
+                high = split - (split - v)
+                error = (high*scale - p) + (v - high)*scale #the exact amount the multiplication was rounded by
+                floor = np.floor(p)
+                above = (p - floor) - 0.5 #exact as well, p - floor is a whole number of ulps below 1
+                rounded[near] = floor + np.where(above == 0, np.where(error == 0, floor % 2 == 1, error > 0), above > 0)
+            
+            rounded /= scale
+            big = ~(np.abs(product) < 2.0**52) #past 2**52 every product is a whole number already (and nan/inf stay as they are)
+            rounded[big] = x[big]
+            out[start:start + rows] = rounded.reshape(out[start:start + rows].shape)
+    return out
 
-today = date.today()
-def get_full_fx_rates():
-     
-    
-    data = pd.read_html(f'http://www.boj.org.jm/foreign_exchange/searchfx.php?iAll=1&iUSD=1&iGBP=1&iCAD=1&iEUR=1&rate=1&high=1&volume=1&low=1&tenday=1&all=1&strFromDate=2000-01-01&strToDate={today}&Enter=')
-    
-    data = data[3]
-    
-    date = []
-
-    for i in range(0,len(data), 6):
-        date.append(data.iloc[i][0])
-
-    date = date[::-1]
-    
-    usd_buy_rates = []
-    usd_buy_volume = []
-    usd_buy_high = []
-    usd_buy_low = []
-    usd_buy_10day = []
-
-    col = 1
-
-    for i in range(1,len(data), 6):
-        usd_buy_rates.append(round(float(data.iloc[i, col]), 2))
-        usd_buy_volume.append(round(float(data.iloc[i+1, col]), 2))
-        usd_buy_high.append(round(float(data.iloc[i+2, col]), 2))
-        usd_buy_low.append(round(float(data.iloc[i+3, col]), 2))
-        usd_buy_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    usd_buy_rates = usd_buy_rates[::-1]
-    usd_buy_volume = usd_buy_volume[::-1]
-    usd_buy_high = usd_buy_high[::-1]
-    usd_buy_low = usd_buy_low[::-1]
-    usd_buy_10day = usd_buy_10day[::-1]
-    
-    
-    usd_buy = {'Date': date,
-               'Exchange Rate':usd_buy_rates,
-               'Volume Traded':usd_buy_volume,
-               'High':usd_buy_high,
-               'Low':usd_buy_low,
-               '10 Day MA':usd_buy_10day,
-    }
-
-    usd_buy = pd.DataFrame.from_dict(usd_buy)
-
-    usd_buy.index = pd.to_datetime(usd_buy['Date'], format='%Y%m%d', errors='ignore')
-    del usd_buy['Date']
-    usd_buy = usd_buy.drop(index='2020-09-03')
-    
-    usd_sell_rates = []
-    usd_sell_volume = []
-    usd_sell_high = []
-    usd_sell_low = []
-    usd_sell_10day = []
-
-    col = 2
-
-    for i in range(1,len(data), 6):
-        usd_sell_rates.append(round(float(data.iloc[i, col]), 2))
-        usd_sell_volume.append(round(float(data.iloc[i+1, col]), 2))
-        usd_sell_high.append(round(float(data.iloc[i+2, col]), 2))
-        usd_sell_low.append(round(float(data.iloc[i+3, col]), 2))
-        usd_sell_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    usd_sell_rates = usd_sell_rates[::-1]
-    usd_sell_volume = usd_sell_volume[::-1]
-    usd_sell_high = usd_sell_high[::-1]
-    usd_sell_low = usd_sell_low[::-1]
-    usd_sell_10day = usd_sell_10day[::-1]
-    
-    usd_sell = {'Date': date,
-               'Exchange Rate':usd_sell_rates,
-               'Volume Traded':usd_sell_volume,
-               'High':usd_sell_high,
-               'Low':usd_sell_low,
-               '10 Day MA':usd_sell_10day,
-    }
-
-    usd_sell = pd.DataFrame.from_dict(usd_sell)
-    usd_sell.index = pd.to_datetime(usd_sell['Date'], format='%Y%m%d', errors='ignore')
-    del usd_sell['Date']
-    usd_sell = usd_sell.drop(index='2020-09-03')
-    
-    gbp_buy_rates = []
-    gbp_buy_volume = []
-    gbp_buy_high = []
-    gbp_buy_low = []
-    gbp_buy_10day = []
-
-    col = 3
-
-    for i in range(1,len(data), 6):
-        gbp_buy_rates.append(round(float(data.iloc[i, col]), 2))
-        gbp_buy_volume.append(round(float(data.iloc[i+1, col]), 2))
-        gbp_buy_high.append(round(float(data.iloc[i+2, col]), 2))
-        gbp_buy_low.append(round(float(data.iloc[i+3, col]), 2))
-        gbp_buy_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    gbp_buy_rates = gbp_buy_rates[::-1]
-    gbp_buy_volume = gbp_buy_volume[::-1]
-    gbp_buy_high = gbp_buy_high[::-1]
-    gbp_buy_low = gbp_buy_low[::-1]
-    gbp_buy_10day = gbp_buy_10day[::-1]
-    
-    gbp_buy = {'Date': date,
-               'Exchange Rate':gbp_buy_rates,
-               'Volume Traded':gbp_buy_volume,
-               'High':gbp_buy_high,
-               'Low':gbp_buy_low,
-               '10 Day MA':gbp_buy_10day,
-    }
-
-    gbp_buy = pd.DataFrame.from_dict(gbp_buy)
-
-    gbp_buy.index = pd.to_datetime(gbp_buy['Date'], format='%Y%m%d', errors='ignore')
-    del gbp_buy['Date']
-    gbp_buy = gbp_buy.drop(index='2020-09-03')
-    
-    
-    gbp_sell_rates = []
-    gbp_sell_volume = []
-    gbp_sell_high = []
-    gbp_sell_low = []
-    gbp_sell_10day = []
-
-    col = 4
-
-    for i in range(1,len(data), 6):
-        gbp_sell_rates.append(round(float(data.iloc[i, col]), 2))
-        gbp_sell_volume.append(round(float(data.iloc[i+1, col]), 2))
-        gbp_sell_high.append(round(float(data.iloc[i+2, col]), 2))
-        gbp_sell_low.append(round(float(data.iloc[i+3, col]), 2))
-        gbp_sell_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    gbp_sell_rates = gbp_sell_rates[::-1]
-    gbp_sell_volume = gbp_sell_volume[::-1]
-    gbp_sell_high = gbp_sell_high[::-1]
-    gbp_sell_low = gbp_sell_low[::-1]
-    gbp_sell_10day = gbp_sell_10day[::-1]
-    
-    gbp_sell = {'Date': date,
-               'Exchange Rate':gbp_sell_rates,
-               'Volume Traded':gbp_sell_volume,
-               'High':gbp_sell_high,
-               'Low':gbp_sell_low,
-               '10 Day MA':gbp_sell_10day,
-    }
-
-    gbp_sell = pd.DataFrame.from_dict(gbp_sell)
-    gbp_sell.index = pd.to_datetime(gbp_sell['Date'], format='%Y%m%d', errors='ignore')
-    del gbp_sell['Date']
-    gbp_sell = gbp_sell.drop(index='2020-09-03')
-    
-    cad_buy_rates = []
-    cad_buy_volume = []
-    cad_buy_high = []
-    cad_buy_low = []
-    cad_buy_10day = []
-
-    col = 5
-
-    for i in range(1,len(data), 6):
-        cad_buy_rates.append(round(float(data.iloc[i, col]), 2))
-        cad_buy_volume.append(round(float(data.iloc[i+1, col]), 2))
-        cad_buy_high.append(round(float(data.iloc[i+2, col]), 2))
-        cad_buy_low.append(round(float(data.iloc[i+3, col]), 2))
-        cad_buy_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    cad_buy_rates = cad_buy_rates[::-1]
-    cad_buy_volume = cad_buy_volume[::-1]
-    cad_buy_high = cad_buy_high[::-1]
-    cad_buy_low = cad_buy_low[::-1]
-    cad_buy_10day = cad_buy_10day[::-1]
-    
-    cad_buy = {'Date': date,
-               'Exchange Rate':cad_buy_rates,
-               'Volume Traded':cad_buy_volume,
-               'High':cad_buy_high,
-               'Low':cad_buy_low,
-               '10 Day MA':cad_buy_10day,
-    }
-
-    cad_buy = pd.DataFrame.from_dict(cad_buy)
-
-    cad_buy.index = pd.to_datetime(cad_buy['Date'], format='%Y%m%d', errors='ignore')
-    del cad_buy['Date']
-    cad_buy = cad_buy.drop(index='2020-09-03')
-    
-    cad_sell_rates = []
-    cad_sell_volume = []
-    cad_sell_high = []
-    cad_sell_low = []
-    cad_sell_10day = []
-
-    col = 6
-
-    for i in range(1,len(data), 6):
-        cad_sell_rates.append(round(float(data.iloc[i, col]), 2))
-        cad_sell_volume.append(round(float(data.iloc[i+1, col]), 2))
-        cad_sell_high.append(round(float(data.iloc[i+2, col]), 2))
-        cad_sell_low.append(round(float(data.iloc[i+3, col]), 2))
-        cad_sell_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    cad_sell_rates = cad_sell_rates[::-1]
-    cad_sell_volume = cad_sell_volume[::-1]
-    cad_sell_high = cad_sell_high[::-1]
-    cad_sell_low = cad_sell_low[::-1]
-    cad_sell_10day = cad_sell_10day[::-1]
-    
-    cad_sell = {'Date': date,
-               'Exchange Rate':cad_sell_rates,
-               'Volume Traded':cad_sell_volume,
-               'High':cad_sell_high,
-               'Low':cad_sell_low,
-               '10 Day MA':cad_sell_10day,
-    }
-
-    cad_sell = pd.DataFrame.from_dict(cad_sell)
-    cad_sell.index = pd.to_datetime(cad_sell['Date'], format='%Y%m%d', errors='ignore')
-    del cad_sell['Date']
-    cad_sell = cad_sell.drop(index='2020-09-03')
-    
-    eur_buy_rates = []
-    eur_buy_volume = []
-    eur_buy_high = []
-    eur_buy_low = []
-    eur_buy_10day = []
-
-    col = 7
-
-    for i in range(1,len(data), 6):
-        eur_buy_rates.append(round(float(data.iloc[i, col]), 2))
-        eur_buy_volume.append(round(float(data.iloc[i+1, col]), 2))
-        eur_buy_high.append(round(float(data.iloc[i+2, col]), 2))
-        eur_buy_low.append(round(float(data.iloc[i+3, col]), 2))
-        eur_buy_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    eur_buy_rates = eur_buy_rates[::-1]
-    eur_buy_volume = eur_buy_volume[::-1]
-    eur_buy_high = eur_buy_high[::-1]
-    eur_buy_low = eur_buy_low[::-1]
-    eur_buy_10day = eur_buy_10day[::-1]
-    
-    eur_buy = {'Date': date,
-               'Exchange Rate':eur_buy_rates,
-               'Volume Traded':eur_buy_volume,
-               'High':eur_buy_high,
-               'Low':eur_buy_low,
-               '10 Day MA':eur_buy_10day,
-    }
-
-    eur_buy = pd.DataFrame.from_dict(eur_buy)
-
-    eur_buy.index = pd.to_datetime(eur_buy['Date'], format='%Y%m%d', errors='ignore')
-    del eur_buy['Date']
-    eur_buy = eur_buy.drop(index='2020-09-03')
-    
-    eur_sell_rates = []
-    eur_sell_volume = []
-    eur_sell_high = []
-    eur_sell_low = []
-    eur_sell_10day = []
-
-    col = 8
-
-    for i in range(1,len(data), 6):
-        eur_sell_rates.append(round(float(data.iloc[i, col]), 2))
-        eur_sell_volume.append(round(float(data.iloc[i+1, col]), 2))
-        eur_sell_high.append(round(float(data.iloc[i+2, col]), 2))
-        eur_sell_low.append(round(float(data.iloc[i+3, col]), 2))
-        eur_sell_10day.append(round(float(data.iloc[i+4, col]), 2))
-
-    eur_sell_rates = eur_sell_rates[::-1]
-    eur_sell_volume = eur_sell_volume[::-1]
-    eur_sell_high = eur_sell_high[::-1]
-    eur_sell_low = eur_sell_low[::-1]
-    eur_sell_10day = eur_sell_10day[::-1]
-    
-    eur_sell = {'Date': date,
-               'Exchange Rate':eur_sell_rates,
-               'Volume Traded':eur_sell_volume,
-               'High':eur_sell_high,
-               'Low':eur_sell_low,
-               '10 Day MA':eur_sell_10day,
-    }
-
-    eur_sell = pd.DataFrame.from_dict(eur_sell)
-    eur_sell.index = pd.to_datetime(eur_sell['Date'], format='%Y%m%d', errors='ignore')
-    del eur_sell['Date']
-    eur_sell = eur_sell.drop(index='2020-09-03')
+
+@_traced('get_full_fx_rates')
+def get_full_fx_rates(store = None, session = None, compact = False):
+    """
+    Scrapes the rate, volume traded, high, low and 10 day MA of the USD, GBP, CAD and EUR (buy and sell) from the Bank of Jamaica.
+    Returns one dataframe per currency/side, in the same order as FX_SERIES.
+    
+    store: optional HistoryStore. If you pass one, only the days after the last stored row get downloaded and the rest is read from disk.
+    session: optional DataSession. If you pass one, calling this again (e.g. once per pair in a loop) doesn't download anything until the session's ttl runs out.
+    compact: if True, returns everything in one FXHistory instead of eight dataframes
+    
+    """
+    
+    if session is not None:
+        return session.get(('boj_full', str(date.today()), compact), lambda: get_full_fx_rates(store, compact=compact))
+    
+    if store is not None:
+        rates = store.refresh('boj_full', FX_SERIES, _fetch_full_fx_rates)
+        return FXHistory.from_frames(rates) if compact else rates
+    
+    data = _fetch_full_fx_table('2000-01-01')
+    
+    if compact:
+        return FXHistory.from_table(data)
+    
+    usd_buy, usd_sell, gbp_buy, gbp_sell, cad_buy, cad_sell, eur_buy, eur_sell = _parse_full_fx_table(data)
     
     return usd_buy, usd_sell, gbp_buy, gbp_sell, cad_buy, cad_sell, eur_buy, eur_sell
 
-##########################################################################################################################
\ No newline at end of file
+
+def _fetch_full_fx_table(start_date):
+    return _read_table(_fetch_page(BOJ_FULL_URL.format(start_date=start_date, end_date=date.today())), 3)
+
+
+def _fetch_full_fx_rates(start_date):
+    return _parse_full_fx_table(_fetch_full_fx_table(start_date))
+
+##########################################################################################################################
+
+class FXHistory:
+    """
+    All eight BoJ series in one compact block, instead of eight float64 dataframes that each carry their own copy of the dates.
+    
+    Every value from the BoJ is rounded to 2 decimals, so they are stored as whole cents:
+    
+        rates:  int32, (dates x currency x side x field) with the fields Exchange Rate, High, Low and 10 Day MA
+        volume: (dates x currency x side), int32 when the volumes fit, int64 otherwise
+    
+    with one shared DatetimeIndex. That is a bit over a third of the memory of the dataframes. Missing values are stored
+    as the smallest int32/int64 (MISSING) and come back as NaN.
+    
+    view() and volume_view() hand out dataframes that sit right on top of the arrays (still in cents, nothing is copied),
+    and frame()/to_frames() give back the same float dataframes get_full_fx_rates returns.
+    
+    """
+    
+    CURRENCIES = ['USD', 'GBP', 'CAD', 'EUR']
+    SIDES = ['BUY', 'SELL']
+    RATE_FIELDS = ['Exchange Rate', 'High', 'Low', '10 Day MA']
+    
+    def __init__(self, index, rates, volume):
+        self.index = index
+        self.rates = rates
+        self.volume = volume
+    
+    @classmethod
+    def from_values(cls, index, values):
+        """values: (dates x fields x series) floats, with the fields in FX_FIELDS order and the series in FX_SERIES order"""
+        n = len(index)
+        fields = [FX_FIELDS.index(field) for field in cls.RATE_FIELDS]
+        rates = values[:, fields, :].reshape(n, len(fields), len(cls.CURRENCIES), len(cls.SIDES)).transpose(0, 2, 3, 1)
+        volume = values[:, FX_FIELDS.index('Volume Traded'), :].reshape(n, len(cls.CURRENCIES), len(cls.SIDES))
+        
+        volume_dtype = np.int32 if np.nanmax(np.abs(volume), initial=0)*100 < np.iinfo(np.int32).max else np.int64
+        return cls(index, _to_cents(rates, np.int32), _to_cents(volume, volume_dtype))
+    
+    @classmethod
+    @_traced('FXHistory.from_table', before=lambda cls, data: {'rows': len(data)})
+    def from_table(cls, data):
+        """Builds it straight from the raw BoJ table, without making the eight dataframes first."""
+        return cls.from_values(*_full_fx_values(data))
+    
+    @classmethod
+    def from_frames(cls, rates):
+        """Builds it from the tuple returned by get_full_fx_rates."""
+        return cls.from_values(rates[0].index, np.stack([frame[FX_FIELDS].to_numpy(dtype=np.float64) for frame in rates], axis=-1))
+    
+    def _position(self, series):
+        currency, side = series.split()
+        return self.CURRENCIES.index(currency), self.SIDES.index(side)
+    
+    def view(self, series):
+        """The rates of one series ('USD BUY', ...) in cents, as a dataframe on top of the array: nothing is copied."""
+        c, s = self._position(series)
+        return pd.DataFrame(self.rates[:, c, s, :], index=self.index, columns=self.RATE_FIELDS, copy=False)
+    
+    def volume_view(self, series):
+        """The volume traded of one series in cents, as a series on top of the array: nothing is copied."""
+        c, s = self._position(series)
+        return pd.Series(self.volume[:, c, s], index=self.index, name='Volume Traded', copy=False)
+    
+    def frame(self, series):
+        """One series as a float dataframe, laid out like the ones get_full_fx_rates returns."""
+        c, s = self._position(series)
+        rates = _from_cents(self.rates[:, c, s, :])
+        frame = pd.DataFrame(rates, index=self.index, columns=self.RATE_FIELDS, copy=False)
+        frame.insert(1, 'Volume Traded', _from_cents(self.volume[:, c, s]))
+        return frame
+    
+    def to_frames(self):
+        return tuple(self.frame(series) for series in FX_SERIES)
+    
+    @property
+    def nbytes(self):
+        return self.rates.nbytes + self.volume.nbytes + self.index.nbytes
+
+
+MISSING = {np.dtype(np.int32): np.iinfo(np.int32).min, np.dtype(np.int64): np.iinfo(np.int64).min}
+
+
+def _to_cents(values, dtype):
+    cents = np.rint(np.nan_to_num(values, nan=0)*100).astype(dtype)
+    cents[np.isnan(values)] = MISSING[np.dtype(dtype)]
+    return np.ascontiguousarray(cents)
+
+
+def _from_cents(cents):
+    values = cents/100
+    values[cents == MISSING[cents.dtype]] = np.nan
+    return values
+
+##########################################################################################################################
+
+class HistoryStore:
+    """
+    Keeps the scraped histories on disk so that a refresh only has to download the days we don't have yet.
+    
+    Every series lives in its own folder (path/source/key) as three files: the dates (int64 nanoseconds), the values
+    (float64, one row per date) and a small json file with the column names, the number of rows and the date the history
+    was first asked from. New rows are appended to the end of the binary files, and reads are memory-mapped, so nothing
+    gets copied until it is used. Asking for dates before the start of the stored history downloads it again from the
+    earlier date, and the series gets rewritten.
+    
+    path: the folder the store lives in. It gets created if it doesn't exist.
+    
+    """
+    
+    def __init__(self, path = 'history'):
+        self.path = path
+    
+    def _folder(self, source, key):
+        return os.path.join(self.path, source, str(key).replace('/', '_'))
+    
+    def _meta(self, source, key):
+        try:
+            with open(os.path.join(self._folder(source, key), 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def last_date(self, source, key):
+        """Returns the date of the last stored row, or None if nothing is stored for that series yet."""
+        meta = self._meta(source, key)
+        if not meta or not meta['rows']:
+            return None
+        index = np.memmap(os.path.join(self._folder(source, key), 'index.bin'), dtype=np.int64, mode='r', shape=(meta['rows'],))
+        return pd.Timestamp(int(index[-1]))
+    
+    def first_date(self, source, key):
+        """Returns the date the stored history was first asked from, or None if nothing is stored for that series yet."""
+        meta = self._meta(source, key)
+        if meta is None:
+            return None
+        if 'start' in meta:
+            return pd.Timestamp(meta['start'])
+        if not meta['rows']: #stores written before the start was kept
+            return None
+        index = np.memmap(os.path.join(self._folder(source, key), 'index.bin'), dtype=np.int64, mode='r', shape=(1,))
+        return pd.Timestamp(int(index[0]))
+    
+    def read(self, source, key):
+        """
+        Returns the stored series as a dataframe sitting on top of the memory-mapped files, or None if there isn't one.
+        The files are mapped copy-on-write: the frame can be edited like any other, and the edits never reach the disk.
+        """
+        meta = self._meta(source, key)
+        if meta is None:
+            return None
+        
+        folder = self._folder(source, key)
+        shape = (meta['rows'], len(meta['columns']))
+        if meta['rows']:
+            index = np.memmap(os.path.join(folder, 'index.bin'), dtype=np.int64, mode='r', shape=shape[:1])
+            values = np.memmap(os.path.join(folder, 'values.bin'), dtype=np.float64, mode='c', shape=shape)
+        else:
+            index, values = np.empty(0, dtype=np.int64), np.empty(shape)
+        
+        index = pd.DatetimeIndex(np.asarray(index).view('datetime64[ns]'), name=meta['index'])
+        return pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+    
+    def append(self, source, key, frame, start = None):
+        """
+        Adds the rows of frame that come after the last stored row. Every column has to be numeric.
+        start: the date the data was asked from, if nothing is stored yet. Defaults to the first row of frame.
+        """
+        folder = self._folder(source, key)
+        os.makedirs(folder, exist_ok=True)
+        meta = self._meta(source, key) or {'columns': [str(c) for c in frame.columns], 'index': frame.index.name, 'rows': 0}
+        
+        index = pd.to_datetime(frame.index).as_unit('ns')
+        frame = frame.set_axis(index).sort_index()
+        last = self.last_date(source, key)
+        if last is not None:
+            frame = frame[frame.index > last]
+        frame = frame.reindex(columns=meta['columns'])
+        if 'start' not in meta and not meta['rows'] and (start is not None or len(frame)):
+            meta['start'] = _format_date(start if start is not None else frame.index[0])
+        
+        #whatever an interrupted append left past the stored rows is cut off first, so the new rows line up with the count
+        with open(os.path.join(folder, 'index.bin'), 'ab') as f:
+            f.truncate(meta['rows']*8)
+            f.write(frame.index.asi8.astype(np.int64).tobytes())
+        with open(os.path.join(folder, 'values.bin'), 'ab') as f:
+            f.truncate(meta['rows']*len(meta['columns'])*8)
+            f.write(np.ascontiguousarray(frame.to_numpy(dtype=np.float64)).tobytes())
+        
+        #the row count is only bumped once the data is on disk, so an interrupted append is simply ignored on the next read
+        meta['rows'] += len(frame)
+        self._write_meta(folder, meta)
+    
+    def _write_meta(self, folder, meta):
+        with open(os.path.join(folder, 'meta.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(folder, 'meta.json.tmp'), os.path.join(folder, 'meta.json'))
+    
+    def _rewrite(self, source, key, frame, start):
+        #merges a download that goes back further than the stored history into it, and writes the whole series again
+        folder = self._folder(source, key)
+        meta = self._meta(source, key)
+        frame = frame.set_axis(pd.to_datetime(frame.index).as_unit('ns')).reindex(columns=meta['columns'])
+        stored = self.read(source, key)
+        frame = pd.concat([frame, stored[~stored.index.isin(frame.index)]]).sort_index() #the fresh download wins where both have a date
+        
+        for name, data in [('index.bin', frame.index.asi8.astype(np.int64)), ('values.bin', frame.to_numpy(dtype=np.float64))]:
+            with open(os.path.join(folder, name + '.tmp'), 'wb') as f:
+                f.write(np.ascontiguousarray(data).tobytes())
+            os.replace(os.path.join(folder, name + '.tmp'), os.path.join(folder, name))
+        
+        meta.update(rows=len(frame), start=_format_date(start))
+        self._write_meta(folder, meta)
+    
+    @_traced('store refresh', before=lambda self, source, keys, *args, **kwargs: {'source': source})
+    def refresh(self, source, keys, fetch, start_date = '2000-01-01', end_date = None):
+        """
+        Brings one or more series from the same download up to date and returns them.
+        
+        keys: a key, or a list of keys if fetch returns one dataframe per key
+        fetch: a function that takes a start date ('yyyy-mm-dd') and downloads everything from that date on
+        start_date: the first date we want. If the stored history starts later, it gets downloaded again from this date.
+        end_date: the last date we want, today by default
+        
+        """
+        single = isinstance(keys, str)
+        keys = [keys] if single else list(keys)
+        start_date = _format_date(start_date)
+        
+        lasts = [self.last_date(source, key) for key in keys]
+        firsts = [self.first_date(source, key) for key in keys]
+        if None in lasts:
+            frames = fetch(start_date)
+            for key, frame in zip(keys, [frames] if single else frames):
+                self.append(source, key, frame, start_date)
+        elif len(business_days(start_date, min(firsts) - pd.Timedelta(days=1))): #asked for days before the stored history
+            frames = fetch(start_date)
+            for key, frame in zip(keys, [frames] if single else frames):
+                self._rewrite(source, key, frame, start_date)
+        elif len(business_days(min(lasts) + pd.Timedelta(days=1), end_date or date.today())): #no download on weekends, there's nothing new
+            try:
+                frames = fetch(_format_date(min(lasts) + pd.Timedelta(days=1)))
+            except MissingTableError: #the sites send back a page without the table when there is nothing new
+                frames = None
+            if frames is not None:
+                for key, frame in zip(keys, [frames] if single else frames):
+                    self.append(source, key, frame)
+        
+        return self.read(source, keys[0]) if single else tuple(self.read(source, key) for key in keys)
+
+##########################################################################################################################
+
+class DataSession:
+    """
+    Remembers what the loaders downloaded and parsed, so that a loop over pairs or SMA windows only pays for one download.
+    
+    Results are keyed by source, ticker and date range. Every call hands back a shallow copy of the cached result: with
+    pandas' copy-on-write (the default from pandas 3) that costs nothing and changes made by the caller never reach the cache.
+    On older pandas without copy-on-write the copies are deep, so the cache is still safe to share.
+    
+    ttl: how many seconds a result stays valid
+    maxsize: how many results to keep. The least recently used one is dropped first.
+    
+    """
+    
+    def __init__(self, ttl = 3600, maxsize = 32):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, load):
+        """Returns the cached result for key, calling load() to build it if it is missing or expired."""
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < self.ttl:
+                self._cache.move_to_end(key)
+                return _view(hit[1])
+        
+        value = load() #done outside of the lock so that other keys aren't blocked by a slow download
+        
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return _view(value)
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def _view(value):
+    if isinstance(value, tuple):
+        return tuple(_view(v) for v in value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=not _copy_on_write())
+    return value
+
+
+def _copy_on_write():
+    return int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+
+##########################################################################################################################
+
+class Panel:
+    """
+    Every JMD pair and JSE ticker on one date index, so FX and equity analyses don't each have to line the dates up.
+    
+    Everything sits in one (dates x columns) float array: the eight FX_SERIES columns first, then one close price column
+    per ticker. select() hands back a smaller panel that points into the same array (a date range and a list of column
+    positions), so picking sub-panels out of the full universe copies nothing until its fx, prices, cross rates or
+    returns are asked for, and then only that sub-block is built.
+    
+    fx: the JMD rates, one column per FX_SERIES, as returned by get_fx_rates (or fx_frame(get_full_fx_rates()))
+    prices: optional close prices, one column per ticker, as returned by get_jse_data_many
+    how: 'inner' keeps the dates that have both rates and prices. 'outer' keeps every date, and carries the last rate
+         and price forward over the days one of them is missing.
+    
+    """
+    
+    CURRENCIES = ['USD', 'GBP', 'CAD', 'EUR'] #the order of the currencies in FX_SERIES
+    
+    def __init__(self, fx, prices = None, how = 'inner'):
+        fx = fx[FX_SERIES]
+        prices = pd.DataFrame(index=fx.index[:0]) if prices is None else prices
+        
+        index = fx.index.union(prices.index) if how == 'outer' else fx.index.intersection(prices.index) if len(prices.columns) else fx.index
+        frame = pd.concat([fx.reindex(index), prices.reindex(index)], axis=1)
+        if how == 'outer':
+            frame = frame.ffill()
+        
+        self._values = frame.to_numpy(dtype=np.float64)
+        self._index = pd.DatetimeIndex(index, name='Date')
+        self._columns = list(frame.columns)
+        self._rows = slice(0, len(index))
+        self._positions = np.arange(len(self._columns))
+    
+    @classmethod
+    def load(cls, tickers = (), start_date = '2000-01-01', end_date = None, how = 'inner', store = None, session = None):
+        """Downloads the BoJ rates (see get_fx_rates) and the JSE close prices of tickers (see get_jse_data_many) into one panel."""
+        dates = slice(pd.Timestamp(start_date or '2000-01-01'), pd.Timestamp(end_date or date.today()))
+        fx = get_fx_rates(store, session)
+        prices = get_jse_data_many(tickers, start_date, end_date).loc[dates] if len(tickers) else None
+        return cls(fx.loc[dates], prices, how)
+    
+    def select(self, currencies = None, tickers = None, start = None, end = None):
+        """
+        Returns the sub-panel with only these currencies ('USD', 'GBP', ...), tickers and dates, sharing this panel's data.
+        None keeps all of them.
+        
+        """
+        panel = object.__new__(Panel)
+        panel._values, panel._index, panel._columns = self._values, self._index, self._columns
+        
+        dates = self.index
+        first = self._rows.start + (dates.searchsorted(pd.Timestamp(start)) if start is not None else 0)
+        last = self._rows.start + (dates.searchsorted(pd.Timestamp(end), side='right') if end is not None else len(dates))
+        panel._rows = slice(first, last)
+        
+        keep = [self._columns[p] for p in self._positions]
+        if currencies is not None:
+            keep = [c for c in keep if c not in FX_SERIES or c.split()[0] in currencies]
+        if tickers is not None:
+            tickers = [ticker.upper() for ticker in tickers]
+            keep = [c for c in keep if c in FX_SERIES or c in tickers]
+        panel._positions = np.array([self._columns.index(c) for c in keep], dtype=np.intp)
+        return panel
+    
+    @property
+    def index(self):
+        return self._index[self._rows]
+    
+    @property
+    def currencies(self):
+        series = self._selected(FX_SERIES)
+        return [c for c in self.CURRENCIES if f'{c} BUY' in series]
+    
+    @property
+    def tickers(self):
+        return [self._columns[p] for p in self._positions if self._columns[p] not in FX_SERIES]
+    
+    def _selected(self, names):
+        return [self._columns[p] for p in self._positions if self._columns[p] in names]
+    
+    def _block(self, columns):
+        #the values of these columns over the selected dates, as one (dates x columns) array
+        return self._values[self._rows, [self._columns.index(c) for c in columns]]
+    
+    @property
+    def fx(self):
+        """The JMD rates of the selected currencies, one column per currency/side."""
+        columns = [c for c in FX_SERIES if c in self._selected(FX_SERIES)]
+        return pd.DataFrame(self._block(columns), index=self.index, columns=columns)
+    
+    @property
+    def prices(self):
+        """The close prices of the selected tickers, one column per ticker."""
+        return pd.DataFrame(self._block(self.tickers), index=self.index, columns=self.tickers)
+    
+    def rates(self, side = 'mid'):
+        """JMD per unit of each selected currency: the 'BUY' or 'SELL' rate, or 'mid' for the average of the two."""
+        currencies = self.currencies
+        if side == 'mid':
+            values = (self._block([f'{c} BUY' for c in currencies]) + self._block([f'{c} SELL' for c in currencies]))/2
+        else:
+            values = self._block([f'{c} {side.upper()}' for c in currencies])
+        return pd.DataFrame(values, index=self.index, columns=currencies)
+    
+    def cross_rates(self, pairs = None, side = 'mid'):
+        """
+        The exchange rates between the foreign currencies implied by their JMD rates: 'GBP/USD' is the USD per GBP, the
+        JMD per GBP divided by the JMD per USD.
+        
+        pairs: a list like ['GBP/USD', 'EUR/CAD']. By default every pair of the selected currencies.
+        side: which JMD rates to divide, 'BUY', 'SELL' or 'mid'
+        
+        """
+        rates = self.rates(side)
+        currencies = list(rates.columns)
+        if pairs is None:
+            pairs = [f'{currencies[j]}/{currencies[i]}' for i in range(len(currencies)) for j in range(i + 1, len(currencies))]
+        
+        base = [currencies.index(pair.split('/')[0]) for pair in pairs]
+        quote = [currencies.index(pair.split('/')[1]) for pair in pairs]
+        values = rates.to_numpy()
+        return pd.DataFrame(values[:, base]/values[:, quote], index=rates.index, columns=list(pairs))
+    
+    def returns(self, currency = None, side = 'mid'):
+        """
+        Daily returns of the selected tickers. In JMD by default, or as seen by someone holding `currency` (e.g. 'USD'):
+        the JMD return times the change in the value of the JMD against that currency.
+        
+        """
+        prices = self._block(self.tickers)
+        growth = prices[1:]/prices[:-1]
+        if currency is not None:
+            rate = self.select(currencies=[currency]).rates(side).to_numpy()[:, 0]
+            growth = growth*(rate[:-1]/rate[1:])[:, None] #the JMD buys less of the currency when the rate goes up
+        
+        returns = np.full(prices.shape, np.nan)
+        returns[1:] = growth - 1
+        return pd.DataFrame(returns, index=self.index, columns=self.tickers)
+
+##########################################################################################################################
+
+def fx_frame(rates, field = 'Exchange Rate'):
+    """
+    Puts one field of every series returned by get_full_fx_rates side by side: one column per currency/side (FX_SERIES),
+    on the shared date index.
+    
+    """
+    return pd.concat({name: frame[field] for name, frame in zip(FX_SERIES, rates)}, axis=1)
+
+
+class RollingFeatures:
+    """
+    Works out rolling statistics (simple and exponential moving averages, standard deviation, min and max) for many
+    windows and many series at once, and keeps them up to date one day at a time.
+    
+    transform() does the whole history in one vectorized pass: the moving averages come from running (prefix) sums, so
+    every window costs the same no matter how long it is, and the standard deviation, min and max are taken over a
+    sliding window view of the rows. The standard deviation isn't taken from running sums of squares, which lose
+    digits on a long history and come out above 0 for flat windows. update() then takes one new row and only touches
+    the last few values, so adding a day doesn't redo 20 years of history. The series shouldn't have missing values.
+    
+    windows: the window lengths, e.g. the (3, 4, 7) SMAs the notebook tries, or 10 for the BoJ's own 10 day MA
+    stats: which of 'sma', 'ema', 'std', 'min' and 'max' to work out
+    
+    The results have one column per (series, feature), e.g. ('USD BUY', 'SMA 3'). The standard deviation uses ddof=1 and
+    the EMA uses span=window with adjust=False, the same as pandas' rolling().std() and ewm(span=window, adjust=False).mean().
+    
+    """
+    
+    def __init__(self, windows = (3, 4, 7, 10), stats = ('sma', 'ema', 'std', 'min', 'max')):
+        self.windows = np.array(sorted(set(windows)))
+        self.stats = list(stats)
+        self.alpha = 2/(self.windows + 1)
+    
+    def transform(self, frame):
+        """Works out every feature for the whole history in frame (one column per series) and remembers where it left off."""
+        self.columns = frame.columns
+        x = frame.to_numpy(dtype=np.float64)
+        n, k = x.shape
+        
+        self.offset = x[0].copy() #the running sums are taken around the first value, so they stay small and exact over 20 years
+        shifted = x - self.offset
+        sums = np.vstack([np.zeros((1, k)), np.cumsum(shifted, axis=0)])
+        
+        features, last_ema = {}, []
+        for w, alpha in zip(self.windows, self.alpha):
+            ema = frame.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+            last_ema.append(ema[-1] if n else np.full(k, np.nan))
+            
+            total = np.full((n, k), np.nan)
+            total[w-1:] = sums[w:] - sums[:-w]
+            windows = np.lib.stride_tricks.sliding_window_view(x, w, axis=0) if n >= w else np.empty((0, k, w)) #(dates - w + 1, series, w)
+            padding = np.full((min(w-1, n), k), np.nan) #the first days don't have a full window yet
+            
+            if 'sma' in self.stats:
+                features[f'SMA {w}'] = total/w + self.offset
+            if 'ema' in self.stats:
+                features[f'EMA {w}'] = ema
+            if 'std' in self.stats:
+                features[f'STD {w}'] = np.vstack([padding, windows.std(axis=-1, ddof=1)]) if w > 1 else np.full((n, k), np.nan)
+            if 'min' in self.stats:
+                features[f'MIN {w}'] = np.vstack([padding, windows.min(axis=-1)])
+            if 'max' in self.stats:
+                features[f'MAX {w}'] = np.vstack([padding, windows.max(axis=-1)])
+        
+        #what update() needs to carry on: the last rows, the running sums of each window and the last EMA of each window
+        self.count = n
+        self.buffer = np.full((self.windows[-1], k), np.nan)
+        tail = x[-self.windows[-1]:]
+        self.buffer[-len(tail):] = tail
+        self.position = 0 #the buffer is a ring, this is where the next row goes (it's also where the oldest row is)
+        self.sum = np.array([shifted[-w:].sum(axis=0) for w in self.windows])
+        self.ema = np.array(last_ema)
+        
+        names = list(features)
+        self.labels = pd.MultiIndex.from_product([self.columns, names]) #built once, every update reuses it
+        values = np.stack([features[name] for name in names], axis=-1) #(dates x series x features)
+        return pd.DataFrame(values.reshape(n, -1), index=frame.index, columns=self.labels)
+    
+    def update(self, row):
+        """Adds one new day (one value per series) and returns the features for that day, in the same layout as a row of transform()."""
+        x = np.asarray(row.reindex(self.columns) if isinstance(row, pd.Series) else row, dtype=np.float64)
+        shifted = x - self.offset
+        size = len(self.buffer)
+        
+        full = self.count >= self.windows #the windows that already have enough rows to drop their oldest value
+        oldest = self.buffer[(self.position - self.windows) % size] - self.offset
+        self.sum += shifted - np.where(full[:, None], oldest, 0)
+        self.ema = np.where(np.isnan(self.ema), x, self.alpha[:, None]*x + (1 - self.alpha[:, None])*self.ema)
+        
+        self.buffer[self.position] = x
+        self.position = (self.position + 1) % size
+        self.count += 1
+        
+        ready = (self.count >= self.windows)[:, None]
+        features = {}
+        for i, w in enumerate(self.windows):
+            recent = self.buffer[(self.position - np.arange(1, w + 1)) % size]
+            if 'sma' in self.stats:
+                features[f'SMA {w}'] = np.where(ready[i], self.sum[i]/w + self.offset, np.nan)
+            if 'ema' in self.stats:
+                features[f'EMA {w}'] = self.ema[i]
+            if 'std' in self.stats:
+                features[f'STD {w}'] = np.where(ready[i], recent.std(axis=0, ddof=1), np.nan) if w > 1 else np.full(len(x), np.nan)
+            if 'min' in self.stats:
+                features[f'MIN {w}'] = np.where(ready[i], recent.min(axis=0), np.nan)
+            if 'max' in self.stats:
+                features[f'MAX {w}'] = np.where(ready[i], recent.max(axis=0), np.nan)
+        
+        values = np.stack(list(features.values()), axis=-1)
+        return pd.Series(values.reshape(-1), index=self.labels)
+
+##########################################################################################################################
+
+def fx_arrays(rates, target = 'Exchange Rate', features = ('Volume Traded', 'High', 'Low', '10 Day MA')):
+    """
+    Stacks the series returned by get_full_fx_rates (which all share one date index) into the arrays BatchedRegression
+    works on: X is (series x dates x features) and y is (series x dates).
+    
+    """
+    X = np.stack([frame[list(features)].to_numpy(dtype=np.float64) for frame in rates])
+    y = np.stack([frame[target].to_numpy(dtype=np.float64) for frame in rates])
+    return X, y
+
+
+class BatchedRegression:
+    """
+    Linear regression (the same fit as sklearn's LinearRegression) for many series at once, e.g. all eight FX pairs.
+    
+    fit() builds each series' normal equations (X'X and X'y) with one einsum and solves them all with one batched
+    np.linalg.solve, instead of one LinearRegression per pair. Those sums are all it keeps, so update() can add new days
+    by adding their sums and solving again: a few microseconds instead of a refit on the whole history.
+    
+    The features are centred and scaled (with the mean and std of the first fit) before the sums are taken, otherwise
+    the volumes, which are millions of times bigger than the rates, make the normal equations impossible to solve
+    accurately. The coefficients are given back in the original units.
+    
+    fit_intercept: add an intercept to every model, like LinearRegression does
+    
+    """
+    
+    def __init__(self, fit_intercept = True):
+        self.fit_intercept = fit_intercept
+    
+    def _design(self, X):
+        Z = (np.asarray(X, dtype=np.float64) - self.mean)/self.scale
+        if self.fit_intercept:
+            Z = np.concatenate([Z, np.ones(Z.shape[:-1] + (1,))], axis=-1)
+        return Z
+    
+    @_traced('regression fit', before=lambda self, X, y: {'rows': y.size})
+    def fit(self, X, y):
+        """X: (series x dates x features), y: (series x dates)"""
+        X = np.asarray(X, dtype=np.float64)
+        self.mean = X.mean(axis=1, keepdims=True) if self.fit_intercept else np.zeros((X.shape[0], 1, X.shape[2]))
+        self.scale = X.std(axis=1, keepdims=True)
+        self.scale[self.scale == 0] = 1
+        
+        Z = self._design(X)
+        self.xtx = np.einsum('snf,sng->sfg', Z, Z)
+        self.xty = np.einsum('snf,sn->sf', Z, np.asarray(y, dtype=np.float64))
+        self.n = X.shape[1]
+        return self._solve()
+    
+    def update(self, X, y):
+        """Adds new days to every model. X: (series x new dates x features), or (series x features) for one day."""
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if X.ndim == 2:
+            X, y = X[:, None, :], y[:, None]
+        
+        Z = self._design(X)
+        self.xtx += np.einsum('snf,sng->sfg', Z, Z)
+        self.xty += np.einsum('snf,sn->sf', Z, y)
+        self.n += X.shape[1]
+        return self._solve()
+    
+    def _solve(self):
+        beta = _solve_normal(self.xtx, self.xty)
+        k = self.mean.shape[-1]
+        self.coef_ = beta[:, :k]/self.scale[:, 0]
+        self.intercept_ = (beta[:, k] if self.fit_intercept else 0) - np.einsum('sf,sf->s', self.coef_, self.mean[:, 0])
+        return self
+    
+    def predict(self, X):
+        """X: (series x dates x features), or (series x features) for one day. Returns (series x dates), or (series,)."""
+        return np.einsum('s...f,sf->s...', np.asarray(X, dtype=np.float64), self.coef_) + (self.intercept_[:, None] if np.ndim(X) == 3 else self.intercept_)
+    
+    def score(self, X, y):
+        """The R squared of every model, like LinearRegression.score."""
+        y = np.asarray(y, dtype=np.float64)
+        residual = ((y - self.predict(X))**2).sum(axis=1)
+        total = ((y - y.mean(axis=1, keepdims=True))**2).sum(axis=1)
+        return 1 - residual/total
+
+
+def _solve_normal(xtx, xty):
+    #solves a batch of normal equations, (series x features x features) and (series x features), in one go
+    try:
+        return np.linalg.solve(xtx, xty[..., None])[..., 0]
+    except np.linalg.LinAlgError: #a feature that never changes, or fewer days than features
+        return np.einsum('sfg,sg->sf', np.linalg.pinv(xtx), xty)
+
+
+def _sma_target(rate, sma):
+    #what the notebook's models predict from (series x dates) rates: the rate itself for predict_fx (sma=None), its
+    #sma day SMA for predict_fx_sma. The first sma - 1 days have no SMA and are NaN, the notebook drops them
+    if sma is None:
+        return rate
+    y = np.full_like(rate, np.nan)
+    y[:, sma-1:] = np.lib.stride_tricks.sliding_window_view(rate, sma, axis=1).mean(axis=-1)
+    return y
+
+
+def _standardized(X, rows = slice(None)):
+    #(series x dates x features) centred and scaled with the mean and std of the days in rows, plus a column of ones for
+    #the intercept. The scaling is only there to keep the sums of squares accurate, it doesn't change the fitted predictions
+    mean, scale = X[:, rows].mean(axis=1, keepdims=True), X[:, rows].std(axis=1, keepdims=True)
+    scale[scale == 0] = 1
+    Z = (X - mean)/scale
+    return np.concatenate([Z, np.ones(Z.shape[:-1] + (1,))], axis=-1)
+
+
+def _map_shared(func, data, tasks, max_workers):
+    """
+    Runs func(shm_name, shape, *task) for every task and returns the results in order. data goes into one shared memory
+    block that every worker reads from (see _attach), instead of being pickled to each of them.
+    max_workers: how many processes to use. None uses every core, 0 runs everything in this process.
+    """
+    from multiprocessing import shared_memory
+    from concurrent.futures import ProcessPoolExecutor
+    
+    shm = shared_memory.SharedMemory(create=True, size=data.nbytes)
+    try:
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[:] = data
+        tasks = [(shm.name, data.shape) + tuple(task) for task in tasks]
+        workers = max_workers if max_workers is not None else os.cpu_count()
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(func, *zip(*tasks)))
+        return [func(*task) for task in tasks]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+@contextmanager
+def _attach(shm_name, shape):
+    #the float64 array a worker of _map_shared reads from, for as long as the block is open
+    from multiprocessing import shared_memory
+    
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        yield np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    finally:
+        shm.close()
+
+##########################################################################################################################
+
+class ModelRegistry:
+    """
+    Keeps the fitted FX models on disk, so predictions can be served without refitting.
+    
+    Every model lives in its own folder (path/name) as a .npy file of coefficients, one row per series with the
+    intercept last, and a small json file with the series, the features and the hash of the data it was fitted on.
+    The coefficients are memory-mapped when loaded. fit() only refits when the data's hash has changed, so calling
+    it on every run costs one hash of the history until a new day comes in.
+    
+    path: the folder the registry lives in. It gets created if it doesn't exist.
+    
+    """
+    
+    def __init__(self, path = 'models'):
+        self.path = path
+    
+    def fit(self, rates, sma = None, name = None):
+        """
+        Returns the model for rates (the tuple returned by get_full_fx_rates), fitting and saving it first if it isn't
+        stored yet or was fitted on different data. The models are set up like in walk_forward: sma=None is predict_fx,
+        a window w is predict_fx_sma(sma=w). The name defaults to 'predict_fx' or 'predict_fx_sma_w'.
+        
+        """
+        name = name or ('predict_fx' if sma is None else f'predict_fx_sma_{sma}')
+        features = FX_FIELDS[1:] if sma is None else FX_FIELDS
+        X, y = fx_arrays(rates, features=features)
+        index = rates[0].index
+        if sma is not None: #the first days of an SMA have no target, so they're left out like the notebook's dropna
+            y, X, index = _sma_target(y, sma)[:, sma-1:], X[:, sma-1:], index[sma-1:]
+        
+        version = data_hash(index, X, y)
+        meta = self._meta(name)
+        if meta is not None and meta['hash'] == version:
+            return self.model(name)
+        
+        model = BatchedRegression().fit(X, y)
+        meta = {'hash': version, 'series': FX_SERIES[:len(rates)], 'features': list(features), 'sma': sma,
+                'rows': len(index), 'last_date': str(index[-1].date()) if len(index) else None}
+        
+        folder = os.path.join(self.path, name)
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, 'coef.tmp.npy'), np.column_stack([model.coef_, model.intercept_]))
+        os.replace(os.path.join(folder, 'coef.tmp.npy'), os.path.join(folder, 'coef.npy'))
+        with open(os.path.join(folder, 'meta.json.tmp'), 'w') as f: #written last, so a model is only ever read with its own coefficients
+            json.dump(meta, f)
+        os.replace(os.path.join(folder, 'meta.json.tmp'), os.path.join(folder, 'meta.json'))
+        return self.model(name)
+    
+    def _meta(self, name):
+        try:
+            with open(os.path.join(self.path, name, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def model(self, name = 'predict_fx'):
+        """Loads a stored model, with its coefficients memory-mapped. Raises KeyError if there isn't one by that name."""
+        meta = self._meta(name)
+        if meta is None:
+            raise KeyError(f'No model called {name} in {self.path}')
+        return FXModel(np.load(os.path.join(self.path, name, 'coef.npy'), mmap_mode='r'), meta)
+    
+    def names(self):
+        """The names of the stored models."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if os.path.exists(os.path.join(self.path, name, 'meta.json')))
+
+
+class FXModel:
+    """
+    A fitted model of every FX series, as loaded from a ModelRegistry.
+    
+    coef: (series x features + 1) coefficients, the intercept last
+    series, features, sma, hash: what it was fitted on, see ModelRegistry.fit
+    
+    """
+    
+    def __init__(self, coef, meta):
+        self.coef = coef
+        self.series = meta['series']
+        self.features = meta['features']
+        self.sma = meta['sma']
+        self.hash = meta['hash']
+        self.last_date = meta['last_date']
+    
+    def predict_many(self, pairs, feature_rows):
+        """
+        Predicts many days for many pairs with one batched matrix multiply.
+        
+        pairs: names from FX_SERIES, e.g. ['USD BUY', 'GBP SELL']
+        feature_rows: (pairs x dates x features), one set of rows per pair, or (dates x features) to use the same rows
+                      for every pair. The features are in the model's order (self.features).
+        
+        Returns a (pairs x dates) array.
+        
+        """
+        weights = self.coef[[self.series.index(pair) for pair in pairs]]
+        rows = np.asarray(feature_rows, dtype=np.float64)
+        if rows.ndim == 2:
+            rows = np.broadcast_to(rows, (len(pairs),) + rows.shape)
+        return np.matmul(rows, weights[:, :-1, None])[..., 0] + weights[:, -1:]
+
+
+def data_hash(*arrays):
+    """A sha256 of the arrays (or DatetimeIndexes) given, to tell whether the data behind a model has changed."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array.asi8 if isinstance(array, pd.DatetimeIndex) else np.asarray(array, dtype=np.float64))
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+##########################################################################################################################
+
+@_traced('walk_forward')
+def walk_forward(rates, sma_windows = (None,), min_train = 252, step = 21, mode = 'expanding', train_size = None, max_workers = None):
+    """
+    Walk-forward backtest of the notebook's regression models, for every FX series and every SMA window at once.
+    
+    Instead of one 85/15 split, the models are refit every `step` days and tested on the `step` days that follow, from
+    `min_train` days in until the end of the history. With mode='expanding' every refit uses all the days before it, with
+    mode='rolling' only the last `train_size` days.
+    
+    Each SMA window is set up like the notebook does it: with None the model predicts the Exchange Rate from the
+    Volume Traded, High, Low and 10 Day MA (predict_fx), with a window w it predicts the w day SMA of the rate from all
+    five columns (predict_fx_sma(sma=w)). Either way the predictions are scored against the actual Exchange Rate.
+    
+    The folds are split across a process pool. The data goes into one shared memory block that every worker reads from,
+    instead of being pickled to each of them, and every worker turns it into running sums of X'X and X'y once, so each
+    refit is a subtraction and a small solve instead of a fit on the whole training window.
+    
+    rates: the tuple returned by get_full_fx_rates (or a HistoryStore read of it)
+    max_workers: how many processes to use. None uses every core, 0 runs everything in this process.
+    
+    Returns one row per (SMA, fold, series) with the train and test dates and the test MAE, RMSE and R squared.
+    The SMA column is 0 for the plain predict_fx setup.
+    
+    """
+    
+    data = np.stack([frame[FX_FIELDS].to_numpy(dtype=np.float64) for frame in rates]) #(series x dates x fields)
+    dates = rates[0].index
+    n = data.shape[1]
+    
+    folds = [(0 if mode == 'expanding' else max(0, t - (train_size or min_train)), t, min(t + step, n)) for t in range(min_train, n, step)]
+    
+    chunks = max(1, (max_workers if max_workers is not None else os.cpu_count()) or 1)
+    tasks = [(sma, folds[i::chunks]) for sma in sma_windows for i in range(chunks) if folds[i::chunks]]
+    results = pd.concat(_map_shared(_walk_forward_task, data, tasks, max_workers), ignore_index=True)
+    for column in ['Train Start', 'Train End', 'Test Start', 'Test End']:
+        results[column] = dates[results[column].to_numpy()]
+    return results.sort_values(['SMA', 'Test Start', 'Series'], ignore_index=True)
+
+
+def _walk_forward_task(shm_name, shape, sma, folds):
+    #runs in a worker: scores one SMA window over a set of folds, reading the data from the shared memory block
+    with _attach(shm_name, shape) as data:
+        actual = data[:, :, 0].copy()
+        X, y = (data[:, :, 1:] if sma is None else data), _sma_target(actual, sma)
+        
+        last = max(end for _, _, end in folds)
+        first = 0 if sma is None else sma - 1 #the first days of an SMA have no target
+        
+        Z = _standardized(X[:, :last], slice(first, last))
+        target = np.nan_to_num(y[:, :last])
+        Z[:, :first] = 0 #so the days without a target add nothing to the sums
+        
+        #running sums over the days: the sums for any train window are the difference of two rows
+        xtx = np.concatenate([np.zeros((1,) + (shape[0], Z.shape[-1], Z.shape[-1])), np.cumsum(np.einsum('snf,sng->nsfg', Z, Z), axis=0)])
+        xty = np.concatenate([np.zeros((1, shape[0], Z.shape[-1])), np.cumsum(np.einsum('snf,sn->nsf', Z, target), axis=0)])
+        
+        rows = []
+        for start, end_train, end_test in folds:
+            start = max(start, first)
+            beta = _solve_normal(xtx[end_train] - xtx[start], xty[end_train] - xty[start])
+            predicted = np.einsum('snf,sf->sn', Z[:, end_train:end_test], beta)
+            truth = actual[:, end_train:end_test]
+            error = predicted - truth
+            total = ((truth - truth.mean(axis=1, keepdims=True))**2).sum(axis=1)
+            
+            rows.append(pd.DataFrame({'SMA': sma or 0, 'Series': FX_SERIES[:shape[0]],
+                                      'Train Start': start, 'Train End': end_train - 1, 'Test Start': end_train, 'Test End': end_test - 1,
+                                      'Train Days': end_train - start,
+                                      'MAE': np.abs(error).mean(axis=1),
+                                      'RMSE': np.sqrt((error**2).mean(axis=1)),
+                                      'R2': np.where(total > 0, 1 - (error**2).sum(axis=1)/np.where(total > 0, total, 1), np.nan)}))
+        del X, data #the block can only be closed once nothing points into it
+    return pd.concat(rows, ignore_index=True)
+
+
+@_traced('sweep')
+def sweep(rates, sma_windows = (None, 3, 4, 7), feature_sets = None, train_fractions = (0.85,), metric = 'RMSE', prune = True, max_workers = None):
+    """
+    Tries every combination of SMA window, feature set and train fraction of the notebook's models, for every FX series,
+    and ranks them. No plots are drawn.
+    
+    A model is set up like in walk_forward (None is predict_fx, a window w is predict_fx_sma(sma=w)), trained on the first
+    train fraction of the days, like the notebook's 85/15 split, and scored against the actual Exchange Rate on the rest.
+    
+    The work is split across a process pool that reads the data from one shared memory block. Every worker sums X'X and
+    X'y for all five columns once per SMA window and train fraction: the model for any feature set is then a solve on a
+    slice of those sums, so a whole grid of feature sets costs little more than one of them.
+    
+    rates: the tuple returned by get_full_fx_rates. Pass rates[:6] for the notebook's six pairs.
+    sma_windows: None for the plain predict_fx setup, or SMA windows
+    feature_sets: lists of FX_FIELDS to train on. By default the notebook's: everything but the Exchange Rate for
+                  predict_fx, and all five columns for an SMA. Sets with the Exchange Rate are skipped for predict_fx,
+                  since that's the value it predicts.
+    train_fractions: the share of the days used for training
+    metric: 'MAE', 'RMSE' (both averaged over the series) or 'R2', what the configurations are ranked by
+    prune: if True, drops every configuration that is dominated, i.e. another one with the same SMA window and train
+           fraction does at least as well on the metric with no more features. Every window keeps at least its best one. This is a filter on the scores: every configuration is
+           still solved and scored. Each worker filters its own rows before sending them back, and the rest is
+           filtered once all the rows are in.
+    max_workers: how many processes to use. None uses every core, 0 runs everything in this process.
+    
+    Returns one row per configuration, best first: its rank, SMA (0 for predict_fx), features, train fraction, the
+    mean MAE, RMSE and R squared over the series and the worst RMSE of any series.
+    
+    """
+    
+    data = np.stack([frame[FX_FIELDS].to_numpy(dtype=np.float64) for frame in rates]) #(series x dates x fields)
+    
+    tasks = []
+    workers = max_workers if max_workers is not None else os.cpu_count()
+    for sma in sma_windows:
+        sets = feature_sets if feature_sets is not None else [FX_FIELDS[1:]] if sma is None else [FX_FIELDS]
+        sets = [[FX_FIELDS.index(f) for f in features] for features in sets if sma is not None or 'Exchange Rate' not in features]
+        chunks = max(1, min(workers or 1, len(sets)))
+        tasks += [(sma, sets[i::chunks], tuple(train_fractions), metric, prune) for i in range(chunks) if sets[i::chunks]]
+    
+    results = pd.concat(_map_shared(_sweep_task, data, tasks, max_workers), ignore_index=True)
+    if prune:
+        results = results[_undominated(results, metric)]
+    results = results.sort_values(metric, ascending=metric != 'R2', ignore_index=True)
+    results.insert(0, 'Rank', np.arange(1, len(results) + 1))
+    return results
+
+
+def _sweep_task(shm_name, shape, sma, feature_sets, train_fractions, metric, prune):
+    #runs in a worker: scores one SMA window with a set of feature sets and every train fraction
+    with _attach(shm_name, shape) as data:
+        actual = data[:, :, 0].copy()
+        first = 0 if sma is None else sma - 1 #the first days of an SMA have no target, so they're left out like the notebook's dropna
+        Z = _standardized(data, slice(first, None))[:, first:]
+        y, actual = _sma_target(actual, sma)[:, first:], actual[:, first:]
+        del data #the block can only be closed once nothing points into it
+    
+    rows = []
+    done, xtx, xty = 0, 0, 0
+    for fraction in sorted(train_fractions):
+        split = int(round(Z.shape[1]*fraction, 0))
+        xtx = xtx + np.einsum('snf,sng->sfg', Z[:, done:split], Z[:, done:split]) #the sums only grow with the split, so each fraction adds to the last one
+        xty = xty + np.einsum('snf,sn->sf', Z[:, done:split], y[:, done:split])
+        done = split
+        
+        truth = actual[:, split:]
+        total = ((truth - truth.mean(axis=1, keepdims=True))**2).sum(axis=1)
+        for features in feature_sets:
+            columns = features + [shape[-1]] #and the intercept
+            beta = _solve_normal(xtx[:, columns][:, :, columns], xty[:, columns])
+            error = np.einsum('snf,sf->sn', Z[:, split:, columns], beta) - truth
+            rmse = np.sqrt((error**2).mean(axis=1))
+            rows.append({'SMA': sma or 0, 'Features': ', '.join(FX_FIELDS[f] for f in features), 'Feature Count': len(features),
+                         'Train Fraction': fraction, 'MAE': np.abs(error).mean(), 'RMSE': rmse.mean(),
+                         'R2': np.mean(np.where(total > 0, 1 - (error**2).sum(axis=1)/np.where(total > 0, total, 1), np.nan)),
+                         'Worst RMSE': rmse.max()})
+    
+    results = pd.DataFrame(rows)
+    return results[_undominated(results, metric)] if prune else results
+
+
+def _undominated(results, metric):
+    #True for the configurations that no other one with the same SMA window and train fraction beats (or ties) on the
+    #metric with no more features. Windows aren't compared with each other, each one keeps its own best configurations
+    score = results[metric].to_numpy() * (-1 if metric == 'R2' else 1) #lower is better
+    count = results['Feature Count'].to_numpy()
+    fraction = results['Train Fraction'].to_numpy()
+    sma = results['SMA'].to_numpy()
+    
+    same = (fraction[:, None] == fraction[None, :]) & (sma[:, None] == sma[None, :])
+    at_least_as_good = (score[:, None] <= score[None, :]) & (count[:, None] <= count[None, :])
+    better = (score[:, None] < score[None, :]) | (count[:, None] < count[None, :])
+    return ~(same & at_least_as_good & better).any(axis=0)
+
+##########################################################################################################################
+
+class FXService:
+    """
+    Keeps the FX models live: new daily BoJ rates and JSE closes are fed in as they arrive, and every update only moves
+    the running state forward (rolling features, drawdowns, regression sums) instead of re-scraping and refitting the
+    whole history. The latest predictions, drawdowns and features can be queried over http while it runs.
+    
+    rates: the history to start from, as returned by get_full_fx_rates
+    tickers: the JSE tickers whose drawdowns should be tracked
+    windows: the SMA/EMA windows to keep up to date (10 also fills in the 10 Day MA when an update doesn't have it)
+    learn: if True, every new day is also added to the regression (BatchedRegression.update), otherwise the coefficients stay as fitted
+    store: optional HistoryStore the new rows get appended to
+    
+    The model has the notebook's predict_fx features (volume, high, low and 10 day MA), but it is fitted on the whole
+    history against the next day's rate instead of the same day's. So the prediction made from each day's numbers is a
+    forecast of the next business day's rate.
+    
+    A BoJ update that is missing some values (a series, or a field of one) gets them from the last day we have, with a
+    warning, so the running state never sees a NaN. Carried forward days aren't learnt from. An update without any
+    rate at all is skipped.
+    
+    Feed it with run(source), where source is an async iterator of updates such as replay() or poll(). An update is a dict:
+    
+        {'date': '2021-01-04', 'source': 'boj', 'values': {'USD BUY': {'Exchange Rate': 146.1, 'Volume Traded': ..., ...}, ...}}
+        {'date': '2021-01-04', 'source': 'jse', 'values': {'NCBFG': 120.5, ...}}
+    
+    """
+    
+    def __init__(self, rates, tickers = (), windows = (3, 4, 7, 10), learn = False, store = None):
+        frame = fx_frame(rates)
+        self.features = RollingFeatures(windows, stats=('sma', 'ema', 'std'))
+        self.latest_features = self.features.transform(frame).iloc[-1]
+        self.fx_drawdown = DrawdownMonitor(FX_SERIES)
+        self.fx_drawdown.update(frame.pct_change().iloc[1:])
+        self.last_rate = frame.iloc[-1].to_numpy()
+        
+        X, y = fx_arrays(rates)
+        self.model = BatchedRegression().fit(X[:, :-1], y[:, 1:]) #each day's numbers against the next day's rate
+        self.last_X = X[:, -1]
+        self.last_values = np.column_stack([y[:, -1], X[:, -1]]) #(series x FX_FIELDS), what a missing value is filled in with
+        self.last_complete = True
+        self.predictions = self.model.predict(self.last_X)
+        
+        self.tickers = [ticker.upper() for ticker in tickers]
+        self.jse_drawdown = DrawdownMonitor(self.tickers)
+        self.last_close = np.full(len(self.tickers), np.nan)
+        
+        self.last_date = {'boj': frame.index[-1], 'jse': None}
+        self.learn = learn
+        self.store = store
+        self.latency = {'updates': 0, 'last_us': 0.0, 'mean_us': 0.0, 'max_us': 0.0}
+    
+    @_traced('service ingest', before=lambda self, update: {'source': update['source']})
+    def ingest(self, update):
+        """Applies one update (see the class docstring). Updates for days we already have are skipped."""
+        start = time.perf_counter_ns()
+        day = pd.Timestamp(update['date'])
+        source = update['source']
+        if self.last_date[source] is not None and day <= self.last_date[source]:
+            return False
+        
+        if source == 'boj':
+            if not self._ingest_fx(day, update['values']):
+                return False
+        else:
+            self._ingest_jse(day, update['values'])
+        self.last_date[source] = day
+        
+        took = (time.perf_counter_ns() - start)/1000
+        count = self.latency['updates'] + 1
+        self.latency = {'updates': count, 'last_us': took, 'mean_us': self.latency['mean_us'] + (took - self.latency['mean_us'])/count, 'max_us': max(self.latency['max_us'], took)}
+        return True
+    
+    def _ingest_fx(self, day, values):
+        values = np.array([[values.get(series, {}).get(field, np.nan) for field in FX_FIELDS] for series in FX_SERIES], dtype=np.float64)
+        if np.isnan(values[:, 0]).all():
+            warnings.warn(f'Skipped the BoJ update for {day.date()}, it has no rates')
+            return False
+        
+        #everything is checked and filled in before any of the state moves, so one bad update can't leave NaNs behind
+        missing = np.isnan(values)
+        rate = values[:, 0] = np.where(missing[:, 0], self.last_values[:, 0], values[:, 0])
+        features = self.features.update(rate)
+        if ('USD BUY', 'SMA 10') in features.index: #the BoJ's own 10 day MA, worked out by us if it's missing
+            filled = missing[:, 4] & ~missing[:, 0]
+            values[:, 4] = np.where(filled, features.xs('SMA 10', level=1).to_numpy(), values[:, 4])
+            missing[:, 4] &= ~filled
+        complete = ~missing.any(axis=1)
+        if not complete.all():
+            warnings.warn(f"The BoJ update for {day.date()} is missing values for {', '.join(np.array(FX_SERIES)[~complete])}, the last ones were carried forward")
+            values = np.where(np.isnan(values), self.last_values, values)
+        self.latest_features = features
+        
+        self.fx_drawdown.update(rate/self.last_rate - 1)
+        self.last_rate = rate
+        
+        X = values[:, 1:]
+        if self.learn and self.last_complete and complete.all():
+            self.model.update(self.last_X, rate) #yesterday's numbers, and the rate they were forecasting
+        self.last_X, self.last_values, self.last_complete = X, values, complete.all()
+        self.predictions = self.model.predict(X)
+        
+        if self.store is not None:
+            for series, row in zip(FX_SERIES, values):
+                self.store.append('boj_full', series, pd.DataFrame([row], index=pd.DatetimeIndex([day], name='Date'), columns=FX_FIELDS))
+        return True
+    
+    def _ingest_jse(self, day, closes):
+        close = np.array([closes.get(ticker, np.nan) for ticker in self.tickers], dtype=np.float64)
+        self.jse_drawdown.update(np.where(np.isnan(close) | np.isnan(self.last_close), 0, close/self.last_close - 1))
+        self.last_close = np.where(np.isnan(close), self.last_close, close)
+        
+        if self.store is not None:
+            for ticker, price in zip(self.tickers, close):
+                if not np.isnan(price):
+                    self.store.append('jse', ticker, pd.DataFrame({'Close Price': [price]}, index=pd.DatetimeIndex([day], name='Date')))
+    
+    def query(self, name = ''):
+        """
+        The latest state as plain python (ready for json): 'predictions', 'drawdowns', 'features', 'latency', or everything for ''.
+        The predictions are for the business day ('for') after the last day we have ('date').
+        """
+        parts = {
+            'predictions': lambda: {'date': str(self.last_date['boj'].date()), 'for': str(business_days(self.last_date['boj'] + pd.Timedelta(days=1), self.last_date['boj'] + pd.Timedelta(days=7))[0].date()),
+                                    **dict(zip(FX_SERIES, self.predictions.tolist()))},
+            'drawdowns': lambda: {'fx': self.fx_drawdown.drawdown.to_dict(), 'jse': self.jse_drawdown.drawdown.to_dict()},
+            'features': lambda: {f'{series} {feature}': value for (series, feature), value in self.latest_features.items()},
+            'latency': lambda: self.latency,
+        }
+        if name:
+            return parts[name]()
+        return {part: make() for part, make in parts.items()}
+    
+    async def run(self, source):
+        """Feeds every update from the async iterator source into the service, until it runs out."""
+        async for update in source:
+            self.ingest(update)
+    
+    async def serve(self, host = '127.0.0.1', port = 8050):
+        """
+        Starts the query endpoint: GET /, /predictions, /drawdowns, /features or /latency returns that part of query() as json.
+        Returns the asyncio server, so it can be closed when the service stops.
+        
+        """
+        import asyncio #only the service needs it
+        
+        async def handle(reader, writer):
+            request = (await reader.readline()).split()
+            while (await reader.readline()).strip(): #skips the headers
+                pass
+            
+            try:
+                body, status = json.dumps(self.query(request[1].decode().strip('/'))).encode(), b'200 OK'
+            except (KeyError, IndexError):
+                body, status = b'{"error": "not found"}', b'404 Not Found'
+            
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: application/json\r\nContent-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+            writer.close()
+        
+        return await asyncio.start_server(handle, host, port)
+
+
+async def replay(path, delay = 0):
+    """Replays the updates saved in a json lines file (one FXService update per line), waiting `delay` seconds between them."""
+    import asyncio
+    
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+                await asyncio.sleep(delay)
+
+
+async def poll(fetch, interval = 3600):
+    """
+    Calls fetch() every `interval` seconds (in a thread, so the service keeps answering queries) and passes on the
+    updates it returns. FXService skips the days it already has, so fetch can simply return the last few days every time.
+    
+    """
+    import asyncio
+    
+    while True:
+        for update in await asyncio.to_thread(fetch):
+            yield update
+        await asyncio.sleep(interval)
+
+##########################################################################################################################
+
+@_traced('render_report')
+def render_report(path, rates = None, prices = None, train_fraction = 0.85, max_workers = None):
+    """
+    Draws the daily chart pack without a display: one chart per FX pair (the actual rate against the predict_fx model's
+    prediction on the last days, like the notebook) and one per JSE ticker (cumulative return and drawdown), and writes
+    them to the folder path as PNGs with an index.html that shows them all, next to a table of the numbers behind them.
+    
+    The charts are drawn on matplotlib's Agg canvas, never through pyplot, so nothing ever waits on plt.show(). They
+    are split across a process pool, and every worker builds one figure per kind of chart and redraws it for each pair
+    or ticker (new data, title and limits) instead of building a new figure every time.
+    
+    rates: optional tuple returned by get_full_fx_rates
+    prices: optional close prices, one column per ticker, as returned by get_jse_data_many
+    train_fraction: the share of the days the FX models are trained on. The charts show the rest.
+    max_workers: how many processes to use. None uses every core, 0 draws everything in this process.
+    
+    Returns the path of index.html.
+    
+    """
+    
+    from concurrent.futures import ProcessPoolExecutor
+    
+    os.makedirs(path, exist_ok=True)
+    charts, tables = [], []
+    
+    if rates is not None:
+        X, y = fx_arrays(rates)
+        split = int(round(X.shape[1]*train_fraction, 0))
+        predicted = BatchedRegression().fit(X[:, :split], y[:, :split]).predict(X[:, split:])
+        dates = rates[0].index[split:].to_numpy()
+        names = [f"JMD/{name.split()[0]} {name.split()[1].title()}" for name in FX_SERIES[:len(rates)]]
+        for k, name in enumerate(names):
+            charts.append(('fx', name, f'Prediction of {name} FX Rate', dates, y[k, split:], predicted[k]))
+        
+        error = predicted - y[:, split:]
+        tables.append(('FX pairs', pd.DataFrame({'MAE': np.abs(error).mean(axis=1), 'RMSE': np.sqrt((error**2).mean(axis=1))}, index=names)))
+    
+    if prices is not None:
+        returns = prices.pct_change().iloc[1:]
+        wealth, _, drawdowns, _ = drawdown_many(returns)
+        for ticker in prices.columns:
+            charts.append(('stock', ticker, ticker, returns.index.to_numpy(), wealth[ticker].to_numpy()/1000 - 1, drawdowns[ticker].to_numpy()))
+        tables.append(('JSE tickers', report_metrics(returns)))
+    
+    workers = max_workers if max_workers is not None else os.cpu_count()
+    chunks = [charts[i::workers] for i in range(workers) if charts[i::workers]] if workers else [charts]
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            files = [f for done in pool.map(_render_charts, [path]*len(chunks), chunks) for f in done]
+    else:
+        files = [f for chunk in chunks for f in _render_charts(path, chunk)]
+    
+    files = dict(files)
+    sections = []
+    for title, kind in [('FX pairs', 'fx'), ('JSE tickers', 'stock')]:
+        images = ''.join(f'<img src="{files[name]}" alt="{name}">' for chart_kind, name, *_ in charts if chart_kind == kind)
+        table = ''.join(t.to_html(float_format=lambda v: f'{v:.4f}') for name, t in tables if name == title)
+        if images:
+            sections.append(f'<h2>{title}</h2>{table}<div>{images}</div>')
+    
+    index = os.path.join(path, 'index.html')
+    with open(index, 'w') as f:
+        f.write(f'<html><head><meta charset="utf-8"><title>Daily charts</title>'
+                f'<style>img {{width: 48%; margin: 0.5%}} table {{border-collapse: collapse}} td, th {{padding: 2px 8px}}</style>'
+                f'</head><body><h1>Daily charts, {date.today()}</h1>{"".join(sections)}</body></html>')
+    return index
+
+
+_TEMPLATES = {} #the figures a render worker reuses, one per kind of chart
+
+
+def _render_charts(path, charts):
+    #runs in a worker: draws every chart on the template figure of its kind and saves it, returns (name, file name) pairs
+    files = []
+    for kind, name, title, dates, first, second in charts:
+        figure, lines = _TEMPLATES.get(kind) or _TEMPLATES.setdefault(kind, _chart_template(kind))
+        for line, values in zip(lines, (first, second)):
+            line.set_data(dates, values)
+        for axes in figure.axes:
+            axes.relim()
+            axes.autoscale_view()
+        figure.axes[0].set_title(title)
+        
+        file = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') + '.png'
+        figure.savefig(os.path.join(path, file))
+        files.append((name, file))
+    return files
+
+
+def _chart_template(kind):
+    from matplotlib.figure import Figure #only needed here, and never through pyplot, so no display backend is involved
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    figure = Figure(figsize=(12, 6), dpi=100)
+    FigureCanvasAgg(figure)
+    if kind == 'fx':
+        axes = figure.subplots()
+        lines = axes.plot([], [], [], []) #actual, predicted
+        axes.xaxis_date()
+        axes.set_xlabel('Date')
+        axes.set_ylabel('Price ($JMD)')
+        axes.legend(lines, ['Actual', 'Predicted'], loc='upper left')
+    else:
+        top, bottom = figure.subplots(2, 1, sharex=True, height_ratios=[2, 1])
+        lines = top.plot([], []) + bottom.plot([], [], color='tab:red')
+        top.xaxis_date()
+        top.set_ylabel('Cumulative Return')
+        bottom.set_ylabel('Drawdown')
+        bottom.set_xlabel('Date')
+    figure.axes[0].set_title(' ') #so tight_layout leaves room for the titles
+    figure.tight_layout()
+    return figure, lines